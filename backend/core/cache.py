@@ -0,0 +1,255 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import closing
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple, TypeVar
+from backend.core.storage import connect
+from backend.models.api_models import ExtractionRequest
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Extraction results are cached in an in-process LRU backed by a SQLite store
+# shared by every worker using the same data directory
+CACHE_ENABLED = os.getenv("EXTRACTOR_CACHE_ENABLED", "1") == "1"
+CACHE_MEMORY_ENTRIES = int(os.getenv("EXTRACTOR_CACHE_MEMORY_ENTRIES", "1024"))
+CACHE_DISK_MAX_MB = int(os.getenv("EXTRACTOR_CACHE_DISK_MAX_MB", "256"))
+CACHE_TTL_SECONDS = int(os.getenv("EXTRACTOR_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+CACHE_DB = "cache.sqlite3"
+# Disk size eviction scans the table, so only run it every so many writes
+EVICTION_INTERVAL = 100
+
+T = TypeVar("T")
+
+
+def make_cache_key(content_hash: str, extraction_request: ExtractionRequest, prompt_text: str) -> str:
+    """Build the cache key of a page from everything that influences the extraction result"""
+    api_config = extraction_request.api_config
+    payload = {
+        "content_hash": content_hash,
+        "schema_definition": extraction_request.schema_definition,
+        "prompt": prompt_text,
+        "provider": api_config.provider.lower(),
+        "model": api_config.model,
+        "base_url": api_config.base_url,
+        "azure_endpoint": api_config.azure_endpoint,
+        "azure_deployment": api_config.azure_deployment,
+        "api_version": api_config.api_version,
+        "temperature": api_config.temperature,
+        "max_tokens": api_config.max_tokens,
+        "image_detail": extraction_request.image_detail,
+        "structured_output": extraction_request.structured_output
+    }
+    # sort_keys normalizes the schema so key order does not change the hash
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """Two-tier extraction result cache: memory LRU in front of a SQLite store"""
+
+    def __init__(self, db_name: str = CACHE_DB, memory_entries: int = CACHE_MEMORY_ENTRIES,
+                 disk_max_mb: int = CACHE_DISK_MAX_MB, ttl_seconds: int = CACHE_TTL_SECONDS):
+        self.db_name = db_name
+        self.memory_entries = memory_entries
+        self.disk_max_bytes = disk_max_mb * 1024 * 1024
+        self.ttl_seconds = ttl_seconds
+        self.memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.initialized = False
+
+    def _connect(self):
+        connection = connect(self.db_name)
+        if not self.initialized:
+            with connection:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS cache (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                """)
+                connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            self.initialized = True
+        return connection
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached result, or None when missing or expired"""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at < self.ttl_seconds:
+                    self.memory.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(value)
+                del self.memory[key]
+
+        try:
+            with closing(self._connect()) as connection, connection:
+                row = connection.execute(
+                    "SELECT value, created_at FROM cache WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl_seconds)
+                ).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        except Exception as e:
+            logger.error(f"Error reading extraction cache: {str(e)}")
+            row = None
+
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, row["created_at"], row["value"])
+        return json.loads(row["value"])
+
+    def set(self, key: str, extracted_data: Dict[str, Any]) -> None:
+        """Store a result in both tiers"""
+        now = time.time()
+        value = json.dumps(extracted_data)
+        with self.lock:
+            self._remember(key, now, value)
+            self.writes += 1
+            evict = self.writes % EVICTION_INTERVAL == 0
+
+        try:
+            with closing(self._connect()) as connection, connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value), now, now)
+                )
+            if evict:
+                self.evict()
+        except Exception as e:
+            logger.error(f"Error writing extraction cache: {str(e)}")
+
+    def _remember(self, key: str, created_at: float, value: str) -> None:
+        self.memory[key] = (created_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until the store fits its size limit"""
+        with closing(self._connect()) as connection, connection:
+            removed = connection.execute(
+                "DELETE FROM cache WHERE created_at <= ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total_size > self.disk_max_bytes:
+                rows = connection.execute("SELECT key, size FROM cache ORDER BY accessed_at").fetchall()
+                stale_keys = []
+                for row in rows:
+                    if total_size <= self.disk_max_bytes:
+                        break
+                    stale_keys.append((row["key"],))
+                    total_size -= row["size"]
+                connection.executemany("DELETE FROM cache WHERE key = ?", stale_keys)
+                removed += len(stale_keys)
+        return removed
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        """Remove one entry, or every entry when no key is given, returning the number removed"""
+        with self.lock:
+            if key is None:
+                self.memory.clear()
+            else:
+                self.memory.pop(key, None)
+        with closing(self._connect()) as connection, connection:
+            if key is None:
+                return connection.execute("DELETE FROM cache").rowcount
+            return connection.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Report hit rates and the size of both tiers"""
+        with closing(self._connect()) as connection:
+            disk_entries, disk_bytes = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": CACHE_ENABLED,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "memory_max_entries": self.memory_entries,
+                "disk_entries": disk_entries,
+                "disk_bytes": disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+extraction_cache = ExtractionCache()
+
+
+# Marks a call abandoned because its leader was cancelled, so a follower takes over
+_ABANDONED = object()
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one.
+
+    The first caller of a key runs the call and the others wait for its result.
+    Futures are thread-safe so callers on different event loops share calls too.
+    """
+
+    def __init__(self):
+        self.calls: Dict[str, concurrent.futures.Future] = {}
+        self.lock = threading.Lock()
+        self.deduplicated = 0
+
+    async def run(self, key: str, call: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Run call, or wait for the identical call in flight, returning its result and whether it was shared"""
+        while True:
+            with self.lock:
+                future = self.calls.get(key)
+                leader = future is None
+                if leader:
+                    future = concurrent.futures.Future()
+                    self.calls[key] = future
+                else:
+                    self.deduplicated += 1
+
+            if not leader:
+                # Shielded so a cancelled follower does not cancel the shared call
+                result = await asyncio.shield(asyncio.wrap_future(future))
+                if result is _ABANDONED:
+                    continue
+                return result, True
+
+            try:
+                result = await call()
+                future.set_result(result)
+                return result, False
+            except asyncio.CancelledError:
+                future.set_result(_ABANDONED)
+                raise
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self.lock:
+                    if self.calls.get(key) is future:
+                        del self.calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"in_flight": len(self.calls), "deduplicated": self.deduplicated}
+
+in_flight_extractions = SingleFlight()
@@ -0,0 +1,142 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import os
+import time
+import weakref
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, Callable, Tuple, TYPE_CHECKING
+from backend.models.api_models import APIConfig
+from backend.core.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import httpx
+else:
+    httpx = lazy_module("httpx")
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Connection pool settings for LLM clients. One pool is kept per provider endpoint,
+# deployment, model and API key; generation settings such as temperature share it.
+LLM_POOL_SIZE = int(os.getenv("EXTRACTOR_LLM_POOL_SIZE", "32"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("EXTRACTOR_LLM_KEEPALIVE_SECONDS", "60"))
+LLM_CLIENT_IDLE_SECONDS = float(os.getenv("EXTRACTOR_LLM_CLIENT_IDLE_SECONDS", "300"))
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("EXTRACTOR_LLM_REQUEST_TIMEOUT_SECONDS", "600"))
+# Chat objects per pool, one for each distinct combination of generation settings
+MAX_CHATS_PER_POOL = 16
+
+ClientKey = Tuple[Any, ...]
+
+
+def get_client_key(api_config: APIConfig) -> ClientKey:
+    """Identify the connection pool of a config, hashing the API key so it is not kept in the key"""
+    return (
+        api_config.provider.lower(),
+        api_config.base_url,
+        api_config.azure_endpoint,
+        api_config.azure_deployment,
+        api_config.api_version,
+        api_config.model,
+        hashlib.sha256(api_config.api_key.encode("utf-8")).hexdigest()
+    )
+
+def create_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Create the keep-alive HTTP clients backing one pool"""
+    limits = httpx.Limits(
+        max_connections=LLM_POOL_SIZE,
+        max_keepalive_connections=LLM_POOL_SIZE,
+        keepalive_expiry=LLM_KEEPALIVE_SECONDS
+    )
+    timeout = httpx.Timeout(LLM_REQUEST_TIMEOUT_SECONDS, connect=10.0)
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+@dataclass
+class PooledClient:
+    """HTTP clients shared by every chat object of one pool"""
+    http_client: httpx.Client
+    http_async_client: httpx.AsyncClient
+    chats: "OrderedDict[Tuple[Any, ...], Any]" = field(default_factory=OrderedDict)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class ClientRegistry:
+    """Reuses LLM clients and their connection pools across pages and requests.
+
+    Async HTTP clients are bound to the event loop that uses them, so there is
+    one registry per event loop (see get_client_registry).
+    """
+
+    def __init__(self, idle_seconds: float = LLM_CLIENT_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.pools: Dict[ClientKey, PooledClient] = {}
+
+    def get(self, api_config: APIConfig, factory: Callable[..., Any]) -> Any:
+        """Get a chat client for the config, building it with factory on top of a pooled connection"""
+        self.evict_idle()
+        key = get_client_key(api_config)
+        pool = self.pools.get(key)
+        if pool is None:
+            http_client, http_async_client = create_http_clients()
+            pool = PooledClient(http_client=http_client, http_async_client=http_async_client)
+            self.pools[key] = pool
+            logger.info(f"Created LLM connection pool for {api_config.provider} {api_config.model}")
+        pool.last_used = time.monotonic()
+
+        settings = (api_config.temperature, api_config.max_tokens)
+        chat = pool.chats.get(settings)
+        if chat is None:
+            chat = factory(api_config, http_client=pool.http_client, http_async_client=pool.http_async_client)
+            pool.chats[settings] = chat
+            while len(pool.chats) > MAX_CHATS_PER_POOL:
+                pool.chats.popitem(last=False)
+        pool.chats.move_to_end(settings)
+        return chat
+
+    def evict_idle(self) -> None:
+        """Close pools that have not been used for idle_seconds"""
+        now = time.monotonic()
+        for key, pool in list(self.pools.items()):
+            if now - pool.last_used > self.idle_seconds:
+                del self.pools[key]
+                self._close_later(pool)
+
+    def _close_later(self, pool: PooledClient) -> None:
+        pool.http_client.close()
+        try:
+            asyncio.get_running_loop().create_task(pool.http_async_client.aclose())
+        except RuntimeError:
+            # No running loop, the connections are dropped with the client
+            pass
+
+    async def aclose(self) -> None:
+        """Close every pool"""
+        pools, self.pools = list(self.pools.values()), {}
+        for pool in pools:
+            pool.http_client.close()
+            await pool.http_async_client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pools": len(self.pools), "chats": sum(len(pool.chats) for pool in self.pools.values())}
+
+
+_registries: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ClientRegistry]" = weakref.WeakKeyDictionary()
+
+def get_client_registry() -> ClientRegistry:
+    """Get the client registry of the running event loop"""
+    loop = asyncio.get_running_loop()
+    registry = _registries.get(loop)
+    if registry is None:
+        registry = ClientRegistry()
+        _registries[loop] = registry
+    return registry
+
+async def close_client_registry() -> None:
+    """Close the pools of the running event loop, e.g. on application shutdown"""
+    registry = _registries.pop(asyncio.get_running_loop(), None)
+    if registry is not None:
+        await registry.aclose()
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from contextlib import closing
+from typing import Dict, List, Any, Iterable, Optional
+from backend.core.storage import connect
+from backend.models.api_models import ExtractionRequest
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Extracted values are also kept per page and per top-level schema field, so a schema
+# that gains fields only pays for the new ones. Values outlive the page-level cache.
+FIELD_STORE_ENABLED = os.getenv("EXTRACTOR_FIELD_STORE_ENABLED", "1") == "1"
+FIELD_STORE_TTL_SECONDS = int(os.getenv("EXTRACTOR_FIELD_STORE_TTL_SECONDS", str(90 * 24 * 3600)))
+
+FIELDS_DB = "fields.sqlite3"
+# Expired values are purged every so many writes
+PURGE_INTERVAL = 1000
+
+
+def make_field_key(content_hash: str, field_name: str, field_definition: Any, extraction_request: ExtractionRequest) -> str:
+    """Build the key of one field of one page from its definition and the settings that influence its value"""
+    api_config = extraction_request.api_config
+    payload = {
+        "content_hash": content_hash,
+        "field_name": field_name,
+        "field_definition": field_definition,
+        "prompt": extraction_request.prompt,
+        "provider": api_config.provider.lower(),
+        "model": api_config.model,
+        "base_url": api_config.base_url,
+        "azure_endpoint": api_config.azure_endpoint,
+        "azure_deployment": api_config.azure_deployment,
+        "api_version": api_config.api_version,
+        "temperature": api_config.temperature,
+        "max_tokens": api_config.max_tokens,
+        "image_detail": extraction_request.image_detail,
+        "structured_output": extraction_request.structured_output
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class FieldStore:
+    """SQLite store of extracted field values, shared by every worker using the same data directory.
+
+    Each value is linked to the page cache keys of the requests it was served to, so
+    invalidating a cache entry also drops the field values behind it.
+    """
+
+    def __init__(self, db_name: str = FIELDS_DB, ttl_seconds: int = FIELD_STORE_TTL_SECONDS):
+        self.db_name = db_name
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.initialized = False
+
+    def _connect(self):
+        connection = connect(self.db_name)
+        if not self.initialized:
+            with connection:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS fields (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                """)
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS field_links (
+                        cache_key TEXT NOT NULL,
+                        field_key TEXT NOT NULL,
+                        PRIMARY KEY (cache_key, field_key)
+                    ) WITHOUT ROWID
+                """)
+                connection.execute("CREATE INDEX IF NOT EXISTS field_links_field_key ON field_links (field_key)")
+            self.initialized = True
+        return connection
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Get the stored values of keys, leaving out missing and expired ones"""
+        try:
+            with closing(self._connect()) as connection:
+                placeholders = ", ".join("?" for _ in keys)
+                rows = connection.execute(
+                    f"SELECT key, value FROM fields WHERE key IN ({placeholders}) AND created_at > ?",
+                    (*keys, time.time() - self.ttl_seconds)
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Error reading field store: {str(e)}")
+            rows = []
+        values = {row["key"]: json.loads(row["value"]) for row in rows}
+        with self.lock:
+            self.hits += len(values)
+            self.misses += len(keys) - len(values)
+        return values
+
+    def set_many(self, values: Dict[str, Any], cache_key: Optional[str] = None, linked_keys: Iterable[str] = ()) -> None:
+        """Store field values by key, linking them and linked_keys to the page cache key they were served under"""
+        linked_keys = set(linked_keys) | set(values)
+        if not linked_keys:
+            return
+        now = time.time()
+        with self.lock:
+            purge = self.writes // PURGE_INTERVAL != (self.writes + len(values)) // PURGE_INTERVAL
+            self.writes += len(values)
+        try:
+            with closing(self._connect()) as connection, connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO fields (key, value, created_at) VALUES (?, ?, ?)",
+                    [(key, json.dumps(value), now) for key, value in values.items()]
+                )
+                if cache_key is not None:
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO field_links (cache_key, field_key) VALUES (?, ?)",
+                        [(cache_key, key) for key in linked_keys]
+                    )
+                if purge:
+                    connection.execute("DELETE FROM fields WHERE created_at <= ?", (now - self.ttl_seconds,))
+                    connection.execute("DELETE FROM field_links WHERE field_key NOT IN (SELECT key FROM fields)")
+        except Exception as e:
+            logger.error(f"Error writing field store: {str(e)}")
+
+    def invalidate(self, cache_key: Optional[str] = None) -> int:
+        """Remove the values served under a page cache key, or every value when no key is given, returning the number removed"""
+        with closing(self._connect()) as connection, connection:
+            if cache_key is None:
+                connection.execute("DELETE FROM field_links")
+                return connection.execute("DELETE FROM fields").rowcount
+            field_keys = [row["field_key"] for row in connection.execute(
+                "SELECT field_key FROM field_links WHERE cache_key = ?", (cache_key,)
+            )]
+            removed = 0
+            for field_key in field_keys:
+                removed += connection.execute("DELETE FROM fields WHERE key = ?", (field_key,)).rowcount
+                connection.execute("DELETE FROM field_links WHERE field_key = ?", (field_key,))
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with closing(self._connect()) as connection:
+            entries = connection.execute("SELECT COUNT(*) FROM fields").fetchone()[0]
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": FIELD_STORE_ENABLED,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": entries,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+field_store = FieldStore()
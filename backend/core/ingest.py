@@ -0,0 +1,113 @@
+import mmap
+import os
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import BytesIO
+from typing import BinaryIO, Iterator, Optional, Union
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Uploads up to this size are kept in memory and handed to PIL as bytes; larger ones
+# are spilled to disk and memory-mapped. PDFs always go to disk since poppler reads files.
+UPLOAD_SPOOL_MAX_BYTES = int(float(os.getenv("EXTRACTOR_UPLOAD_SPOOL_MAX_MB", "4")) * 1024 * 1024)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+@dataclass
+class Upload:
+    """An uploaded file, held in memory when small or spilled to a unique path on disk"""
+    file_name: str
+    size: int
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.file_name)[1].lower()
+
+    @contextmanager
+    def open(self) -> Iterator[BinaryIO]:
+        """Open the upload for reading, without copying it"""
+        if self.data is not None:
+            yield BytesIO(self.data)
+        elif self.size == 0:
+            # Empty files cannot be mapped
+            yield BytesIO(b"")
+        else:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+# A file to extract from: a path on disk or an ingested upload
+FileSource = Union[str, Upload]
+
+
+def get_source_name(source: FileSource) -> str:
+    """Get the file name reported for a source"""
+    return source.file_name if isinstance(source, Upload) else os.path.basename(source)
+
+def get_source_extension(source: FileSource) -> str:
+    return source.extension if isinstance(source, Upload) else os.path.splitext(source)[1].lower()
+
+def get_source_path(source: FileSource) -> str:
+    """Get the path of a source on disk, for tools such as poppler that read files"""
+    if isinstance(source, Upload):
+        if source.path is None:
+            raise ValueError(f"Upload {source.file_name} is held in memory and has no path")
+        return source.path
+    return source
+
+@contextmanager
+def open_source(source: FileSource) -> Iterator[BinaryIO]:
+    """Open a source for reading, mapping spilled uploads instead of reading them"""
+    if isinstance(source, Upload):
+        with source.open() as f:
+            yield f
+    else:
+        with open(source, "rb") as f:
+            yield f
+
+def ingest_upload(file: BinaryIO, file_name: str, upload_dir: str, index: int,
+                  spool_max_bytes: int = UPLOAD_SPOOL_MAX_BYTES) -> Upload:
+    """Read an upload in chunks, spilling it to disk past spool_max_bytes.
+
+    Spilled uploads are written to upload_dir/<index>/<file name>, so files sharing a
+    name in one batch do not overwrite each other. spool_max_bytes=0 always spills.
+    """
+    # Only the base name is trusted, a client can send any path
+    file_name = os.path.basename(file_name)
+    chunks = []
+    size = 0
+    path = None
+    out = None
+    try:
+        if spool_max_bytes <= 0 or os.path.splitext(file_name)[1].lower() == '.pdf':
+            spool_max_bytes = -1
+        while chunk := file.read(UPLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if out is None and size > spool_max_bytes:
+                path = os.path.join(upload_dir, f"{index:04d}", file_name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                out = open(path, "wb")
+                out.writelines(chunks)
+                chunks = []
+            if out is not None:
+                out.write(chunk)
+            else:
+                chunks.append(chunk)
+        if out is None and spool_max_bytes < 0:
+            # Empty uploads that must still be on disk
+            path = os.path.join(upload_dir, f"{index:04d}", file_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "wb").close()
+    except Exception as e:
+        logger.error(f"Error ingesting upload {file_name}: {str(e)}")
+        raise
+    finally:
+        if out is not None:
+            out.close()
+
+    data = b"".join(chunks) if path is None else None
+    return Upload(file_name=file_name, size=size, data=data, path=path)
@@ -0,0 +1,326 @@
+import asyncio
+import json
+import os
+import shutil
+import socket
+import time
+import uuid
+import logging
+from contextlib import closing
+from typing import Dict, List, Set, Any, Optional
+from backend.core.runner import aprocess_files, run_blocking
+from backend.core.storage import connect, data_path
+from backend.models.api_models import ExtractionRequest
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of jobs processed concurrently by one worker process
+JOB_WORKERS = int(os.getenv("EXTRACTOR_JOB_WORKERS", "2"))
+# How long finished jobs and their results are kept before being purged
+JOB_RETENTION_SECONDS = int(os.getenv("EXTRACTOR_JOB_RETENTION_SECONDS", str(24 * 3600)))
+# A running job belongs to the worker process that claimed it for as long as that process
+# renews its lease. Jobs whose lease expired (the process died) are requeued by any worker.
+JOB_LEASE_SECONDS = float(os.getenv("EXTRACTOR_JOB_LEASE_SECONDS", "60"))
+
+JOBS_DB = "jobs.sqlite3"
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+FINISHED_STATUSES = (COMPLETED, FAILED)
+
+
+class JobStore:
+    """SQLite-backed persistence for extraction jobs"""
+
+    def __init__(self, db_name: str = JOBS_DB):
+        self.db_name = db_name
+        with closing(connect(self.db_name)) as connection, connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    request TEXT,
+                    upload_dir TEXT,
+                    file_paths TEXT NOT NULL,
+                    progress TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    heartbeat REAL
+                )
+            """)
+            # Stores created before jobs were leased
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (("owner", "TEXT"), ("heartbeat", "REAL")):
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def _execute(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        with closing(connect(self.db_name)) as connection, connection:
+            return [dict(row) for row in connection.execute(query, params).fetchall()]
+
+    def create(self, job_id: str, extraction_request: ExtractionRequest, upload_dir: str,
+               file_paths: List[str], progress: Dict[str, Any]) -> None:
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, status, created_at, updated_at, request, upload_dir, file_paths, progress) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, now, now, extraction_request.model_dump_json(), upload_dir,
+             json.dumps(file_paths), json.dumps(progress))
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = rows[0]
+        job["file_paths"] = json.loads(job["file_paths"])
+        job["progress"] = json.loads(job["progress"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def update(self, job_id: str, claimed_by: Optional[str] = None, **fields: Any) -> bool:
+        """Update a job, only while claimed_by still owns it when given; returns whether it was updated"""
+        for key in ("progress", "result"):
+            if key in fields and fields[key] is not None:
+                fields[key] = json.dumps(fields[key])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        query = f"UPDATE jobs SET {assignments} WHERE id = ?"
+        params = (*fields.values(), job_id)
+        if claimed_by is not None:
+            query += " AND owner = ? AND status = ?"
+            params += (claimed_by, RUNNING)
+        with closing(connect(self.db_name)) as connection, connection:
+            return connection.execute(query, params).rowcount > 0
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """Atomically mark a queued job as running for owner; False when another worker got it first"""
+        now = time.time()
+        with closing(connect(self.db_name)) as connection, connection:
+            return connection.execute(
+                "UPDATE jobs SET status = ?, owner = ?, heartbeat = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, owner, now, now, job_id, QUEUED)
+            ).rowcount > 0
+
+    def renew(self, job_id: str, owner: str) -> bool:
+        """Extend owner's lease on a running job; False when the lease was lost"""
+        with closing(connect(self.db_name)) as connection, connection:
+            return connection.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND owner = ? AND status = ?",
+                (time.time(), job_id, owner, RUNNING)
+            ).rowcount > 0
+
+    def release(self, job_id: str, owner: str, request: Optional[str]) -> None:
+        """Give a running job back to the queue with its request, e.g. on shutdown"""
+        self._execute(
+            "UPDATE jobs SET status = ?, owner = NULL, heartbeat = NULL, request = ?, updated_at = ? "
+            "WHERE id = ? AND owner = ? AND status = ?",
+            (QUEUED, request, time.time(), job_id, owner, RUNNING)
+        )
+
+    def requeue_expired(self, older_than: float) -> None:
+        """Requeue running jobs whose owner stopped renewing its lease"""
+        self._execute(
+            "UPDATE jobs SET status = ?, owner = NULL, heartbeat = NULL, updated_at = ? "
+            "WHERE status = ? AND (heartbeat IS NULL OR heartbeat < ?)",
+            (QUEUED, time.time(), RUNNING, older_than)
+        )
+
+    def queued(self) -> List[str]:
+        rows = self._execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,))
+        return [row["id"] for row in rows]
+
+    def expired(self, older_than: float) -> List[Dict[str, Any]]:
+        return self._execute(
+            "SELECT id, upload_dir FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (*FINISHED_STATUSES, older_than)
+        )
+
+    def delete(self, job_id: str) -> None:
+        self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+
+def initial_progress(file_paths: List[str]) -> Dict[str, Any]:
+    """Build the progress record of a job that has not started yet"""
+    return {
+        "files": [
+            {"file_name": os.path.basename(file_path), "status": QUEUED, "page_count": None, "pages_completed": 0}
+            for file_path in file_paths
+        ],
+        "pages_total": None,
+        "pages_completed": 0
+    }
+
+
+class JobManager:
+    """Runs extraction jobs on a bounded pool of asyncio workers.
+
+    Several worker processes can share one store: a job is only run by the worker
+    that claims it, and is requeued when that worker stops renewing its lease.
+    """
+
+    def __init__(self, store: Optional[JobStore] = None, workers: int = JOB_WORKERS,
+                 lease_seconds: float = JOB_LEASE_SECONDS):
+        self.store = store
+        self.workers = max(1, workers)
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.queue: Optional[asyncio.Queue] = None
+        # Jobs queued in this process, so the sweep does not queue them twice
+        self.pending: Set[str] = set()
+        self.tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """Start the workers, and the sweep that picks up queued and abandoned jobs"""
+        if self.store is None:
+            self.store = await run_blocking(JobStore)
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        await self.purge_expired()
+        await self.sweep()
+        self.tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self) -> None:
+        """Stop the workers, giving running jobs back to the queue"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def _enqueue(self, job_id: str) -> None:
+        if job_id not in self.pending:
+            self.pending.add(job_id)
+            self.queue.put_nowait(job_id)
+
+    async def sweep(self) -> None:
+        """Requeue jobs of workers that stopped renewing their lease and queue every queued job"""
+        await run_blocking(self.store.requeue_expired, time.time() - self.lease_seconds)
+        for job_id in await run_blocking(self.store.queued):
+            self._enqueue(job_id)
+
+    async def _sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Error sweeping jobs: {str(e)}")
+
+    async def _renew_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await run_blocking(self.store.renew, job_id, self.owner):
+                    logger.warning(f"Lost the lease on job {job_id}")
+                    return
+            except Exception as e:
+                logger.error(f"Error renewing lease on job {job_id}: {str(e)}")
+
+    async def submit(self, file_paths: List[str], upload_dir: str, extraction_request: ExtractionRequest) -> str:
+        """Persist a new job and queue it, returning its id"""
+        if self.queue is None:
+            raise RuntimeError("Job manager is not started")
+        job_id = uuid.uuid4().hex
+        await run_blocking(self.store.create, job_id, extraction_request, upload_dir,
+                           file_paths, initial_progress(file_paths))
+        self._enqueue(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await run_blocking(self.store.get, job_id)
+
+    async def delete(self, job_id: str) -> None:
+        """Delete a job record and whatever is left of its uploads"""
+        job = await self.get(job_id)
+        if job is None:
+            return
+        await run_blocking(self.store.delete, job_id)
+        if job["upload_dir"]:
+            await run_blocking(shutil.rmtree, job["upload_dir"], ignore_errors=True)
+
+    async def purge_expired(self) -> None:
+        """Delete finished jobs older than the retention period"""
+        for job in await run_blocking(self.store.expired, time.time() - JOB_RETENTION_SECONDS):
+            await self.delete(job["id"])
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Error running job {job_id}: {str(e)}")
+            finally:
+                self.pending.discard(job_id)
+                self.queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        if not await run_blocking(self.store.claim, job_id, self.owner):
+            # Deleted, finished or claimed by another worker before it reached the front of the queue
+            return
+        job = await self.get(job_id)
+        if job is None:
+            return
+
+        progress = job["progress"]
+        lease = asyncio.create_task(self._renew_lease(job_id))
+        try:
+            if not job["request"]:
+                raise ValueError("The worker running this job stopped and its API key is not kept, please resubmit it")
+            # The API key is only kept on disk while the job is queued, this worker holds it from here
+            await run_blocking(self.store.update, job_id, claimed_by=self.owner, request=None)
+            if not all(os.path.exists(path) for path in job["file_paths"]):
+                raise ValueError("Job inputs are no longer available")
+            extraction_request = ExtractionRequest.model_validate_json(job["request"])
+
+            async def on_progress(event: Dict[str, Any]) -> None:
+                file_progress = progress["files"][event["file_index"]]
+                if event["event"] == "file_started":
+                    file_progress.update(status=RUNNING, page_count=event["page_count"], pages_completed=0)
+                elif event["event"] in ("page_completed", "page_skipped"):
+                    file_progress["pages_completed"] += event.get("pages", 1)
+                elif event["event"] == "file_completed":
+                    file_progress["status"] = FAILED if "error" in event["file_metadata"] else COMPLETED
+                progress["pages_completed"] = sum(f["pages_completed"] for f in progress["files"])
+                page_counts = [f["page_count"] for f in progress["files"]]
+                progress["pages_total"] = sum(page_counts) if None not in page_counts else None
+                await run_blocking(self.store.update, job_id, claimed_by=self.owner, progress=progress)
+
+            data, usage = await aprocess_files(job["file_paths"], extraction_request, on_progress)
+            finished = await run_blocking(self.store.update, job_id, claimed_by=self.owner, status=COMPLETED,
+                                          progress=progress, result={"data": data, "usage": usage})
+        except asyncio.CancelledError:
+            # Shutting down: let another worker, or this one after a restart, run it
+            self.store.release(job_id, self.owner, job["request"])
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            finished = await run_blocking(self.store.update, job_id, claimed_by=self.owner, status=FAILED,
+                                          progress=progress, error=str(e))
+        finally:
+            lease.cancel()
+
+        if not finished:
+            # The lease expired and another worker took the job over, the uploads are its now
+            logger.warning(f"Job {job_id} was taken over by another worker, discarding this run")
+            return
+        # Uploads are only needed while the job runs
+        if job["upload_dir"]:
+            await run_blocking(shutil.rmtree, job["upload_dir"], ignore_errors=True)
+        await self.purge_expired()
+
+
+def create_upload_dir() -> str:
+    """Create a persistent directory for the uploads of a new job"""
+    upload_dir = data_path("jobs", uuid.uuid4().hex)
+    os.makedirs(upload_dir, mode=0o700)
+    return upload_dir
+
+job_manager = JobManager()
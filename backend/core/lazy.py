@@ -0,0 +1,64 @@
+import importlib
+import threading
+import time
+import logging
+from types import ModuleType
+from typing import Dict, Iterable, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_lazy_modules: Dict[str, "LazyModule"] = {}
+_lazy_modules_lock = threading.Lock()
+
+
+class LazyModule:
+    """Stand-in for a heavy module, imported on first attribute access.
+
+    Keeps langchain, openai, PIL, numpy and pdf2image out of the API process's
+    import time. importlib holds the import lock, so concurrent first uses from
+    worker threads are safe.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}{' (loaded)' if self._module is not None else ''}>"
+
+
+def lazy_module(name: str) -> LazyModule:
+    """Get a module that is only imported when first used"""
+    with _lazy_modules_lock:
+        if name not in _lazy_modules:
+            _lazy_modules[name] = LazyModule(name)
+        return _lazy_modules[name]
+
+
+def warm_up(names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """Import the named lazily loaded modules (default all) now, returning the seconds each took"""
+    if names is None:
+        with _lazy_modules_lock:
+            names = list(_lazy_modules)
+    seconds = {}
+    for name in names:
+        start = time.perf_counter()
+        try:
+            lazy_module(name)._load()
+        except ImportError as e:
+            # Warming up is best effort, the error surfaces again on first use
+            logger.error(f"Error warming up {name}: {str(e)}")
+            continue
+        seconds[name] = round(time.perf_counter() - start, 4)
+    logger.info(f"Warmed up in {sum(seconds.values()):.2f}s: {seconds}")
+    return seconds
@@ -0,0 +1,183 @@
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Iterator, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds, from fast image stages up to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    """Format label pairs in the Prometheus text format"""
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """A metric family with a fixed set of label names, safe to update from any thread"""
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            return [f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}"
+                    for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        """Count what runs inside the block as in progress"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Per label set: bucket counts, sum and count
+        self.values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    bucket_label = f'le="{format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{format_labels(self.label_names, key, bucket_label)} {bucket_count}")
+                lines.append(f"{self.name}_sum{format_labels(self.label_names, key)} {format_value(total)}")
+                lines.append(f"{self.name}_count{format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Collects metric families and renders them for a Prometheus scrape"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "extractor_stage_seconds", "Time spent per page in each pipeline stage", ("stage",)))
+LLM_REQUEST_SECONDS = registry.register(Histogram(
+    "extractor_llm_request_seconds", "Duration of LLM calls", ("provider", "model")))
+LLM_REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "extractor_llm_requests_in_flight", "LLM calls currently waiting for a reply", ("provider", "model")))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "extractor_requests_in_flight", "Extraction requests and jobs currently being processed"))
+LLM_ERRORS = registry.register(Counter(
+    "extractor_llm_errors_total", "Failed LLM calls, including ones that were retried", ("provider", "model", "error")))
+FILE_ERRORS = registry.register(Counter(
+    "extractor_file_errors_total", "Files that failed to process"))
+PAGES = registry.register(Counter(
+    "extractor_pages_total", "Pages processed by extraction mode and outcome", ("mode", "outcome")))
+TOKENS = registry.register(Counter(
+    "extractor_tokens_total", "Tokens billed by the provider", ("provider", "model", "kind")))
+COST = registry.register(Counter(
+    "extractor_cost_usd_total", "Estimated LLM cost in USD", ("provider", "model")))
+
+
+def record_stage(stage: str, seconds: float, timings: Optional[Dict[str, float]] = None) -> None:
+    """Add seconds spent in a stage to the stage histogram and, when given, to timings[stage]"""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+@contextmanager
+def stage_timer(timings: Dict[str, float], stage: str) -> Iterator[None]:
+    """Record the duration of the block as time spent in a stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, timings)
+
+def observe_timings(timings: Dict[str, float]) -> None:
+    """Add stage timings measured in another process to the stage histogram"""
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+def round_timings(timings: Dict[str, float]) -> Dict[str, float]:
+    return {stage: round(seconds, 4) for stage, seconds in timings.items()}
+
+def sum_timings(timings_list: List[Optional[Dict[str, float]]]) -> Dict[str, float]:
+    """Total the per-stage timings of several pages"""
+    totals: Dict[str, float] = {}
+    for timings in timings_list:
+        for stage, seconds in (timings or {}).items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+    return round_timings(totals)
@@ -1,98 +1,713 @@
-from langchain.callbacks import get_openai_callback
-from langchain_openai import ChatOpenAI, AzureChatOpenAI
-from langchain.output_parsers import PydanticOutputParser
-from langchain.schema import HumanMessage
-from PIL import Image
-import pdf2image
+from __future__ import annotations
 import os
 import base64
 from io import BytesIO
 import json
-from typing import Dict, List, Tuple, Any, Optional, Union
+from typing import Dict, List, Tuple, Any, Optional, Union, Callable, Iterator, AsyncIterator, TYPE_CHECKING
 import logging
 import traceback
 import re
-from pydantic import BaseModel, Field, create_model
+import asyncio
+import weakref
+import functools
+import inspect
+import math
+import hashlib
+import copy
+import subprocess
+import time
+from dataclasses import dataclass, field
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pydantic import BaseModel
 from backend.models.api_models import APIConfig, ExtractionRequest
+from backend.core.cache import extraction_cache, in_flight_extractions, make_cache_key, CACHE_ENABLED
+from backend.core.clients import get_client_registry, close_client_registry
+from backend.core.fields import field_store, make_field_key, FIELD_STORE_ENABLED
+from backend.core.ingest import FileSource, get_source_name, get_source_extension, get_source_path, open_source
+from backend.core.schema import CompiledSchema, compile_schema, paginate_schema
+from backend.core.templates import Template, template_registry
+from backend.core.scheduler import rate_limit_scheduler
+from backend.core.triage import PageSignature, PageTriage, analyze_page
+from backend.core.metrics import (
+    stage_timer, record_stage, observe_timings, round_timings, sum_timings, LLM_REQUEST_SECONDS, LLM_REQUESTS_IN_FLIGHT,
+    REQUESTS_IN_FLIGHT, LLM_ERRORS, FILE_ERRORS, PAGES, TOKENS, COST
+)
+from backend.core.lazy import lazy_module, warm_up
+
+# Heavy dependencies are imported on first use, so the API process starts quickly
+if TYPE_CHECKING:
+    import langchain.callbacks as langchain_callbacks
+    import langchain.schema as langchain_schema
+    import langchain_openai
+    import pdf2image
+    from PIL import Image
+else:
+    langchain_callbacks = lazy_module("langchain.callbacks")
+    langchain_schema = lazy_module("langchain.schema")
+    langchain_openai = lazy_module("langchain_openai")
+    pdf2image = lazy_module("pdf2image")
+    Image = lazy_module("PIL.Image")
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Concurrency limits for LLM calls. The global limit caps in-flight calls across
+# every request served by this process; the per-request limit caps the pages of
+# a single request and can be lowered with ExtractionRequest.max_concurrency.
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("EXTRACTOR_MAX_CONCURRENT_LLM_CALLS", "16"))
+DEFAULT_REQUEST_CONCURRENCY = int(os.getenv("EXTRACTOR_REQUEST_CONCURRENCY", "4"))
+
+# One semaphore per event loop, since asyncio primitives are bound to the loop they run on
+_global_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def get_global_semaphore() -> asyncio.Semaphore:
+    """Get the process-wide LLM call semaphore for the running event loop"""
+    loop = asyncio.get_running_loop()
+    semaphore = _global_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, MAX_CONCURRENT_LLM_CALLS))
+        _global_semaphores[loop] = semaphore
+    return semaphore
+
+def create_request_semaphore(extraction_request: ExtractionRequest) -> asyncio.Semaphore:
+    """Create the semaphore bounding concurrent pages for one extraction request"""
+    limit = extraction_request.max_concurrency or DEFAULT_REQUEST_CONCURRENCY
+    return asyncio.Semaphore(max(1, min(limit, MAX_CONCURRENT_LLM_CALLS)))
+
+# Managed executor for blocking work (rasterization, image encoding, file IO) so it
+# never runs on the event loop thread
+BLOCKING_WORKERS = int(os.getenv("EXTRACTOR_BLOCKING_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+_blocking_executor: Optional[ThreadPoolExecutor] = None
+
+def get_blocking_executor() -> ThreadPoolExecutor:
+    """Get the shared executor for blocking work, creating it on first use"""
+    global _blocking_executor
+    if _blocking_executor is None:
+        _blocking_executor = ThreadPoolExecutor(max_workers=max(1, BLOCKING_WORKERS), thread_name_prefix="extractor")
+    return _blocking_executor
+
+def shutdown_blocking_executor() -> None:
+    """Shut down the shared executor, waiting for running work to finish"""
+    global _blocking_executor
+    if _blocking_executor is not None:
+        _blocking_executor.shutdown(wait=True)
+        _blocking_executor = None
+
+async def run_blocking(func, *args, **kwargs) -> Any:
+    """Run a blocking callable on the managed executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_blocking_executor(), functools.partial(func, *args, **kwargs))
+
+# Process pool for the CPU-bound render, resize and encode stage, so pages of concurrent
+# uploads use every core instead of contending for the GIL. 0 prepares pages on threads.
+RENDER_PROCESSES = int(os.getenv("EXTRACTOR_RENDER_PROCESSES", str(os.cpu_count() or 1)))
+# Pages of a file prepared ahead of the LLM stage
+RENDER_PREFETCH_PAGES = int(os.getenv("EXTRACTOR_RENDER_PREFETCH_PAGES", str(max(1, RENDER_PROCESSES))))
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Get the shared page preparation process pool, creating it on first use"""
+    global _render_pool
+    if _render_pool is None:
+        # Spawned rather than forked, the parent runs threads and an event loop
+        _render_pool = ProcessPoolExecutor(max_workers=RENDER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _render_pool
+
+def reset_render_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a pool broken by a dying process (e.g. OOM-killed on a huge page), so the next page starts a new one"""
+    global _render_pool
+    if _render_pool is pool:
+        logger.warning("A page preparation process died, restarting the process pool")
+        _render_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Modules a pool process needs to prepare pages
+RENDER_MODULES = ("PIL.Image", "pdf2image", "numpy")
+
+def start_render_pool(warm: bool = False) -> None:
+    """Start every pool process up front, so the first uploads do not wait for them to import"""
+    if RENDER_PROCESSES <= 0:
+        return
+    pool = get_render_pool()
+    task = functools.partial(warm_up, RENDER_MODULES) if warm else os.getpid
+    for future in [pool.submit(task) for _ in range(RENDER_PROCESSES)]:
+        future.result()
+
+def shutdown_render_pool() -> None:
+    """Shut down the page preparation processes"""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=True, cancel_futures=True)
+        _render_pool = None
+
+# Rasterization settings. Pages are rendered in page ranges whose decoded size stays
+# within the memory budget; stitching all pages into one image is opt-in and capped.
+PDF_DPI = 300
+RASTER_MEMORY_BUDGET_MB = int(os.getenv("EXTRACTOR_RASTER_MEMORY_BUDGET_MB", "256"))
+MAX_STITCHED_PIXELS = int(os.getenv("EXTRACTOR_MAX_STITCHED_PIXELS", "16000000"))
+
+# Image preparation settings matching the image-token accounting of the vision model
+# (gpt-4o family): "high" detail images are fit within 2048x2048, scaled so their
+# shortest side is at most 768px and billed per 512px tile; "low" detail images are
+# billed a flat base cost. Sending pixels beyond that only costs bandwidth.
+IMAGE_MAX_EDGE = int(os.getenv("EXTRACTOR_IMAGE_MAX_EDGE", "2048"))
+IMAGE_SHORT_EDGE = 768
+IMAGE_LOW_DETAIL_EDGE = 512
+IMAGE_TILE_SIZE = 512
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+JPEG_QUALITY = int(os.getenv("EXTRACTOR_JPEG_QUALITY", "85"))
+
+# Text-layer fast path: PDF pages whose text layer has at least this many characters,
+# mostly letters and digits, are sent as text instead of being rasterized
+TEXT_LAYER_MIN_CHARS = int(os.getenv("EXTRACTOR_TEXT_LAYER_MIN_CHARS", "200"))
+TEXT_LAYER_MIN_ALNUM_RATIO = float(os.getenv("EXTRACTOR_TEXT_LAYER_MIN_ALNUM_RATIO", "0.5"))
+
+# Page packing: consecutive pages are sent in one request up to these budgets
+PACK_MAX_PAGES = int(os.getenv("EXTRACTOR_PACK_MAX_PAGES", "10"))
+PACK_MAX_TOKENS = int(os.getenv("EXTRACTOR_PACK_MAX_TOKENS", "8000"))
+PACK_MAX_PAYLOAD_MB = float(os.getenv("EXTRACTOR_PACK_MAX_PAYLOAD_MB", "15"))
+
+# Response format of structured-output requests without a schema
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+
+PACKING_OFF = "off"
+PACKING_PER_PAGE = "per_page"
+PACKING_PER_DOCUMENT = "per_document"
+
+VISION_MODE = "vision"
+TEXT_MODE = "text"
+
+@dataclass
+class PreparedPage:
+    """A page ready for the model: a resized and encoded image, or its text layer"""
+    base64_image: Optional[str]
+    width: int
+    height: int
+    estimated_image_tokens: int
+    content_hash: str
+    text: Optional[str] = None
+    # Blank and duplicate page statistics, when page triage is enabled
+    signature: Optional[PageSignature] = None
+    # Seconds spent preparing the page, per stage
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def extraction_mode(self) -> str:
+        return TEXT_MODE if self.text is not None else VISION_MODE
+
+ProgressCallback = Callable[[Dict[str, Any]], Any]
+
+async def notify_progress(progress_callback: Optional[ProgressCallback], event: Dict[str, Any]) -> None:
+    """Send a progress event to the callback, awaiting it when it is a coroutine function"""
+    if progress_callback is None:
+        return
+    try:
+        result = progress_callback(event)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logger.error(f"Error in progress callback for {event.get('event')} event: {str(e)}")
+
+def run_sync(coroutine) -> Any:
+    """Run a coroutine to completion on a fresh event loop, closing its LLM connection pools"""
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await close_client_registry()
+    return asyncio.run(main())
+
+async def gather_or_cancel(coroutines: List[Any]) -> List[Any]:
+    """Run coroutines concurrently, keeping result order and cancelling the rest on first failure"""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def get_target_size(width: int, height: int, detail: str = "high", max_edge: int = IMAGE_MAX_EDGE) -> Tuple[int, int]:
+    """Get the size an image is reduced to before sending, never upscaling"""
+    if detail == "low":
+        scale = IMAGE_LOW_DETAIL_EDGE / max(width, height)
+    else:
+        scale = min(max_edge / max(width, height), IMAGE_SHORT_EDGE / min(width, height))
+    scale = min(1.0, scale)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def estimate_image_tokens(width: int, height: int, detail: str = "high") -> int:
+    """Estimate the prompt tokens the vision model bills for an image of this size"""
+    if detail == "low":
+        return IMAGE_BASE_TOKENS
+    # The provider applies its own limits, whatever max_edge we resized to
+    width, height = get_target_size(width, height, detail)
+    tiles = math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+
+def get_render_dpi(page_sizes: List[Tuple[float, float]], detail: str = "high", max_edge: int = IMAGE_MAX_EDGE) -> int:
+    """Get the lowest DPI at which every PDF page still covers its target size"""
+    scale = 0.0
+    for width, height in page_sizes:
+        full_width, full_height = width / 72 * PDF_DPI, height / 72 * PDF_DPI
+        target_width, _ = get_target_size(int(full_width), int(full_height), detail, max_edge)
+        scale = max(scale, target_width / full_width)
+    return max(1, min(PDF_DPI, math.ceil(PDF_DPI * scale)))
+
+def prepare_image(image: Image.Image, detail: str = "high", max_edge: int = IMAGE_MAX_EDGE) -> Image.Image:
+    """Resize an image to the target size of the vision model"""
+    try:
+        target_size = get_target_size(image.width, image.height, detail, max_edge)
+        if target_size == image.size:
+            return image
+        # reducing_gap uses cheap box reduction first, then resamples the small image
+        return image.resize(target_size, Image.LANCZOS, reducing_gap=3.0)
+    except Exception as e:
+        logger.error(f"Error preparing image at line {traceback.extract_tb(e.__traceback__)[-1].lineno}: {str(e)}")
+        raise
+
+def get_pdf_page_sizes(pdf_path: str) -> List[Tuple[float, float]]:
+    """Get the size in points of every page of a PDF, accounting for page rotation"""
+    # Keyed on the file identity so the pdfinfo calls run once per file
+    stat = os.stat(pdf_path)
+    return list(read_pdf_page_sizes(pdf_path, stat.st_mtime_ns, stat.st_size))
+
+@functools.lru_cache(maxsize=64)
+def read_pdf_page_sizes(pdf_path: str, mtime_ns: int, size: int) -> Tuple[Tuple[float, float], ...]:
+    """Read page sizes with pdfinfo, see get_pdf_page_sizes"""
+    try:
+        page_count = pdf2image.pdfinfo_from_path(pdf_path)["Pages"]
+        info = pdf2image.pdfinfo_from_path(pdf_path, first_page=1, last_page=page_count)
+        sizes = []
+        for page_number in range(1, page_count + 1):
+            # pdfinfo reports ranges as "Page    1 size: 612 x 792 pts (letter)"
+            size = info.get(f"Page {page_number:>4} size", "")
+            match = re.match(r"([\d.]+) x ([\d.]+)", size)
+            width, height = (float(match.group(1)), float(match.group(2))) if match else (612.0, 792.0)
+            if info.get(f"Page {page_number:>4} rot", "0").strip() in ("90", "270"):
+                width, height = height, width
+            sizes.append((width, height))
+        return tuple(sizes)
+    except Exception as e:
+        logger.error(f"Error reading PDF info {pdf_path}: {str(e)}")
+        raise
+
+def group_page_ranges(page_numbers: List[int], pages_per_range: int) -> List[Tuple[int, int]]:
+    """Group sorted page numbers into ranges of consecutive pages of at most pages_per_range pages"""
+    ranges = []
+    for page_number in page_numbers:
+        if ranges and ranges[-1][1] == page_number - 1 and page_number - ranges[-1][0] < pages_per_range:
+            ranges[-1] = (ranges[-1][0], page_number)
+        else:
+            ranges.append((page_number, page_number))
+    return ranges
+
+def get_page_raster_bytes(page_size: Tuple[float, float], dpi: int) -> int:
+    """Decoded RGB size of a PDF page, from its size in points"""
+    return int(page_size[0] / 72 * dpi) * int(page_size[1] / 72 * dpi) * 3
 
-def convert_pdf_to_images(pdf_path: str) -> List[Image.Image]:
-    """Convert PDF to list of PIL Images"""
+def iter_pdf_pages(pdf_path: str, dpi: int = PDF_DPI, memory_budget_mb: int = RASTER_MEMORY_BUDGET_MB,
+                   page_sizes: Optional[List[Tuple[float, float]]] = None,
+                   page_numbers: Optional[List[int]] = None) -> Iterator[Image.Image]:
+    """Render PDF pages lazily, in page ranges sized to fit the memory budget.
+
+    Only page_numbers (1-based) are rendered when given. Each page is closed once
+    the caller advances the iterator, so it must be consumed (encoded) before
+    asking for the next one.
+    """
     try:
-        # Convert PDF to list of images
-        images = pdf2image.convert_from_path(pdf_path, dpi=300)
+        page_sizes = page_sizes or get_pdf_page_sizes(pdf_path)
+        if page_numbers is None:
+            page_numbers = list(range(1, len(page_sizes) + 1))
+        if not page_numbers:
+            return
+        largest_page_bytes = max(get_page_raster_bytes(page_sizes[n - 1], dpi) for n in page_numbers)
+        pages_per_range = max(1, memory_budget_mb * 1024 * 1024 // max(1, largest_page_bytes))
         
-        # If there's only one page, return it directly
-        if len(images) <= 1:
-            return images
-            
-        # Calculate dimensions for the combined image
-        width = max(img.width for img in images)
-        total_height = sum(img.height for img in images)
+        for first_page, last_page in group_page_ranges(sorted(page_numbers), pages_per_range):
+            images = pdf2image.convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page)
+            images.reverse()
+            while images:
+                image = images.pop()
+                try:
+                    yield image
+                finally:
+                    image.close()
+    except Exception as e:
+        logger.error(f"Error converting PDF {pdf_path} at line {traceback.extract_tb(e.__traceback__)[-1].lineno}: {str(e)}")
+        raise
+
+def stitch_pdf_pages(pdf_path: str, max_pixels: int = MAX_STITCHED_PIXELS) -> Image.Image:
+    """Render all pages of a PDF into one tall image of at most max_pixels pixels"""
+    try:
+        page_sizes = get_pdf_page_sizes(pdf_path)
+        
+        # Lower the DPI up front so the combined canvas never exceeds the pixel cap
+        total_pixels = sum((width / 72 * PDF_DPI) * (height / 72 * PDF_DPI) for width, height in page_sizes)
+        dpi = PDF_DPI if total_pixels <= max_pixels else max(1, int(PDF_DPI * (max_pixels / total_pixels) ** 0.5))
         
-        # Create a new image with the combined dimensions
-        combined_image = Image.new('RGB', (width, total_height))
+        # Calculate dimensions for the combined image, with a pixel of slack per page for rounding
+        width = max(int(page_width / 72 * dpi) + 1 for page_width, _ in page_sizes)
+        total_height = sum(int(page_height / 72 * dpi) + 1 for _, page_height in page_sizes)
+        combined_image = Image.new('RGB', (width, total_height), 'white')
         
-        # Paste each page into the combined image
+        # Paste each page into the combined image as it is rendered
         y_offset = 0
-        for img in images:
-            combined_image.paste(img, (0, y_offset))
-            y_offset += img.height
+        for page in iter_pdf_pages(pdf_path, dpi=dpi, page_sizes=page_sizes):
+            combined_image.paste(page, (0, y_offset))
+            y_offset += page.height
         
-        # Return the combined image as a single-item list to maintain interface
-        return [combined_image]
+        return combined_image.crop((0, 0, width, min(y_offset, total_height)))
     except Exception as e:
-        logger.error(f"Error converting PDF {pdf_path} at line {traceback.extract_tb(e.__traceback__)[-1].lineno}: {str(e)}")
+        logger.error(f"Error stitching PDF {pdf_path} at line {traceback.extract_tb(e.__traceback__)[-1].lineno}: {str(e)}")
         raise
 
-def encode_image_to_base64(image: Image.Image) -> str:
-    """Convert PIL Image to base64 string"""
+def convert_pdf_to_images(pdf_path: str, stitch_pages: bool = False, detail: str = "high",
+                          max_edge: int = IMAGE_MAX_EDGE, page_numbers: Optional[List[int]] = None) -> Iterator[Image.Image]:
+    """Convert PDF to PIL Images, one per page (or per page in page_numbers) or a single stitched image"""
+    if stitch_pages:
+        yield stitch_pdf_pages(pdf_path)
+    else:
+        # Render no finer than the vision model will look at
+        page_sizes = get_pdf_page_sizes(pdf_path)
+        dpi = get_render_dpi(page_sizes, detail, max_edge)
+        yield from iter_pdf_pages(pdf_path, dpi=dpi, page_sizes=page_sizes, page_numbers=page_numbers)
+
+def extract_pdf_text_pages(pdf_path: str, page_count: int) -> List[str]:
+    """Read the text layer of every page with poppler's pdftotext, empty strings when unavailable"""
+    try:
+        result = subprocess.run(
+            ["pdftotext", "-layout", "-enc", "UTF-8", pdf_path, "-"],
+            capture_output=True, timeout=60, check=True
+        )
+        # pdftotext ends every page with a form feed
+        pages = result.stdout.decode("utf-8", "ignore").split("\f")
+    except Exception as e:
+        logger.warning(f"Could not read text layer of {pdf_path}, falling back to vision: {str(e)}")
+        pages = []
+    return (pages + [""] * page_count)[:page_count]
+
+def has_text_layer(text: str) -> bool:
+    """Check whether a page's text layer is rich enough to extract from without the image"""
+    characters = [char for char in text if not char.isspace()]
+    if len(characters) < TEXT_LAYER_MIN_CHARS:
+        return False
+    alnum = sum(1 for char in characters if char.isalnum())
+    return alnum / len(characters) >= TEXT_LAYER_MIN_ALNUM_RATIO
+
+def encode_image_to_jpeg(image: Image.Image, quality: int = JPEG_QUALITY) -> bytes:
+    """Convert PIL Image to JPEG bytes"""
     try:
         buffered = BytesIO()
-        image.save(buffered, format="JPEG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffered, format="JPEG", quality=quality)
+        return buffered.getvalue()
     except Exception as e:
         logger.error(f"Error encoding image at line {traceback.extract_tb(e.__traceback__)[-1].lineno}: {str(e)}")
         raise
 
-def get_image_from_file(file_path: str) -> List[Image.Image]:
-    """Get PIL Image(s) from file path"""
+def encode_image_to_base64(image: Image.Image, quality: int = JPEG_QUALITY) -> str:
+    """Convert PIL Image to base64 string"""
+    return base64.b64encode(encode_image_to_jpeg(image, quality)).decode('utf-8')
+
+def get_page_count(source: FileSource, stitch_pages: bool = False) -> int:
+    """Get the number of pages get_image_from_file will produce for a file"""
+    file_ext = get_source_extension(source)
+    if file_ext == '.pdf' and not stitch_pages:
+        return len(get_pdf_page_sizes(get_source_path(source)))
+    return 1
+
+def get_image_from_file(source: FileSource, stitch_pages: bool = False, detail: str = "high",
+                        max_edge: int = IMAGE_MAX_EDGE) -> Iterator[Image.Image]:
+    """Lazily get PIL Image(s) from a file path or upload, one page at a time"""
     try:
-        file_ext = os.path.splitext(file_path)[1].lower()
+        file_ext = get_source_extension(source)
         if file_ext == '.pdf':
-            return convert_pdf_to_images(file_path)  # Return all pages
+            yield from convert_pdf_to_images(get_source_path(source), stitch_pages, detail, max_edge)
         elif file_ext in ['.jpg', '.jpeg', '.png']:
-            return [Image.open(file_path)]  # Return single image as a list
+            # Uploads are decoded straight from memory or from a memory map of the spilled file
+            with open_source(source) as f, Image.open(f) as image:
+                if image.format == "JPEG":
+                    # Let the JPEG decoder scale down by up to 8x instead of decoding every pixel
+                    image.draft("RGB", get_target_size(image.width, image.height, detail, max_edge))
+                yield image
         else:
             raise ValueError(f"Unsupported file type: {file_ext}")
     except Exception as e:
-        logger.error(f"Error getting image from file {file_path}: {str(e)}")
+        logger.error(f"Error getting image from file {get_source_name(source)}: {str(e)}")
         raise
 
-def create_llm_client(api_config: APIConfig):
-    """Create LLM client based on provider"""
+def prepare_page(image: Image.Image, extraction_request: ExtractionRequest) -> PreparedPage:
+    """Resize and encode a page, estimating its image tokens before the call is sent"""
+    max_edge = extraction_request.image_max_edge or IMAGE_MAX_EDGE
+    timings = {}
+    with stage_timer(timings, "resize"):
+        prepared = prepare_image(image, extraction_request.image_detail, max_edge)
+    try:
+        with stage_timer(timings, "encode"):
+            jpeg_bytes = encode_image_to_jpeg(prepared, extraction_request.jpeg_quality or JPEG_QUALITY)
+        with stage_timer(timings, "base64"):
+            base64_image = base64.b64encode(jpeg_bytes).decode('utf-8')
+        signature = None
+        if extraction_request.page_triage:
+            with stage_timer(timings, "triage"):
+                signature = analyze_page(prepared)
+        return PreparedPage(
+            base64_image=base64_image,
+            width=prepared.width,
+            height=prepared.height,
+            estimated_image_tokens=estimate_image_tokens(prepared.width, prepared.height, extraction_request.image_detail),
+            content_hash=hashlib.sha256(jpeg_bytes).hexdigest(),
+            signature=signature,
+            timings=timings
+        )
+    finally:
+        if prepared is not image:
+            prepared.close()
+
+def prepare_text_page(text: str) -> PreparedPage:
+    """Wrap a page's text layer for a text-only prompt"""
+    return PreparedPage(
+        base64_image=None,
+        width=0,
+        height=0,
+        estimated_image_tokens=0,
+        content_hash=hashlib.sha256(("text:" + text).encode("utf-8")).hexdigest(),
+        text=text
+    )
+
+def prepare_next_page(images: Iterator[Image.Image], extraction_request: ExtractionRequest) -> Optional[PreparedPage]:
+    """Render the next page of images and prepare it, recording the rendering time, or None at the end"""
+    start = time.perf_counter()
+    image = next(images, None)
+    if image is None:
+        return None
+    rasterize_seconds = time.perf_counter() - start
+    record_stage("rasterize", rasterize_seconds)
+    page = prepare_page(image, extraction_request)
+    page.timings = {"rasterize": rasterize_seconds, **page.timings}
+    return page
+
+@dataclass
+class PageJob:
+    """A page to render and prepare in the process pool: a PDF page, or the whole file"""
+    source: FileSource
+    extraction_request: ExtractionRequest
+    page_number: Optional[int] = None
+    dpi: Optional[int] = None
+    # Decoded size of the rendered page, counted against the raster memory budget
+    raster_bytes: int = 0
+
+def plan_page_jobs(source: FileSource, extraction_request: ExtractionRequest) -> List[Union[PageJob, PreparedPage]]:
+    """List the pages of a file in order: jobs for pages to render, prepared pages for text-layer pages"""
+    is_pdf = get_source_extension(source) == '.pdf'
+    if not is_pdf or extraction_request.stitch_pages:
+        return [PageJob(source, extraction_request)]
+    
+    file_path = get_source_path(source)
+    max_edge = extraction_request.image_max_edge or IMAGE_MAX_EDGE
+    page_sizes = get_pdf_page_sizes(file_path)
+    dpi = get_render_dpi(page_sizes, extraction_request.image_detail, max_edge)
+    texts = [""] * len(page_sizes)
+    timings = {}
+    if extraction_request.text_fast_path:
+        with stage_timer(timings, "text_layer"):
+            texts = extract_pdf_text_pages(file_path, len(page_sizes))
+    text_pages = sum(1 for text in texts if has_text_layer(text))
+    
+    jobs = []
+    for page_number, text in enumerate(texts, 1):
+        if has_text_layer(text):
+            page = prepare_text_page(text)
+            # pdftotext reads the whole document at once, its time is shared by the text pages
+            page.timings["text_layer"] = timings["text_layer"] / text_pages
+            jobs.append(page)
+        else:
+            jobs.append(PageJob(source, extraction_request, page_number, dpi,
+                                get_page_raster_bytes(page_sizes[page_number - 1], dpi)))
+    return jobs
+
+def prepare_page_job(job: PageJob) -> PreparedPage:
+    """Render and prepare one page, run in a pool process; only the encoded page is sent back"""
+    extraction_request = job.extraction_request
+    start = time.perf_counter()
+    if job.page_number is not None:
+        # One pdftoppm call per page, so the pages of a document render in parallel
+        images = iter(pdf2image.convert_from_path(get_source_path(job.source), dpi=job.dpi, first_page=job.page_number, last_page=job.page_number))
+    else:
+        max_edge = extraction_request.image_max_edge or IMAGE_MAX_EDGE
+        images = get_image_from_file(job.source, extraction_request.stitch_pages, extraction_request.image_detail, max_edge)
+    try:
+        image = next(images)
+        rasterize_seconds = time.perf_counter() - start
+        page = prepare_page(image, extraction_request)
+        image.close()
+    finally:
+        if hasattr(images, "close"):
+            images.close()
+    page.timings = {"rasterize": rasterize_seconds, **page.timings}
+    return page
+
+async def aiter_prepared_pages(source: FileSource, extraction_request: ExtractionRequest) -> AsyncIterator[PreparedPage]:
+    """Pipeline stage preparing the pages of a file for the LLM stage, in page order.
+
+    Pages are rendered and encoded in the process pool, up to RENDER_PREFETCH_PAGES
+    ahead of the consumer and only as many at once as fit the raster memory budget, or
+    lazily on the blocking executor when the pool is disabled.
+    When a pool process dies the pool is restarted and the page retried once; a page
+    that breaks the pool twice fails its file only.
+    """
+    if RENDER_PROCESSES <= 0:
+        pages = iter_prepared_pages(source, extraction_request)
+        preparing = None
+        try:
+            while True:
+                preparing = get_blocking_executor().submit(next, pages, None)
+                if (page := await asyncio.wrap_future(preparing)) is None:
+                    break
+                yield page
+        finally:
+            if preparing is not None and not preparing.done():
+                # Cancelled while a page is being prepared: the generator can only be closed once it is done
+                await asyncio.wait([asyncio.wrap_future(preparing)])
+            await run_blocking(pages.close)
+        return
+    
+    loop = asyncio.get_running_loop()
+    jobs = deque(await run_blocking(plan_page_jobs, source, extraction_request))
+    pending = deque()
+    
+    def submit(job: Union[PageJob, PreparedPage], attempt: int = 0) -> Tuple[Any, ...]:
+        if isinstance(job, PreparedPage):
+            future = loop.create_future()
+            future.set_result(job)
+            return job, None, future, attempt
+        pool = get_render_pool()
+        try:
+            future = loop.run_in_executor(pool, prepare_page_job, job)
+        except BrokenProcessPool:
+            # Broken while preparing pages of another file
+            reset_render_pool(pool)
+            pool = get_render_pool()
+            future = loop.run_in_executor(pool, prepare_page_job, job)
+        return job, pool, future, attempt
+    
+    def raster_bytes() -> int:
+        return sum(job.raster_bytes for job, _, _, _ in pending if isinstance(job, PageJob))
+    
+    def has_room(job: Union[PageJob, PreparedPage]) -> bool:
+        if len(pending) >= max(1, RENDER_PREFETCH_PAGES):
+            return False
+        # At least one page is always rendered, however large
+        page_bytes = job.raster_bytes if isinstance(job, PageJob) else 0
+        return not pending or raster_bytes() + page_bytes <= RASTER_MEMORY_BUDGET_MB * 1024 * 1024
+    
+    try:
+        while jobs or pending:
+            while jobs and has_room(jobs[0]):
+                pending.append(submit(jobs.popleft()))
+            job, pool, future, attempt = pending[0]
+            try:
+                page = await future
+            except BrokenProcessPool:
+                reset_render_pool(pool)
+                if attempt >= 1:
+                    raise RuntimeError("Preparing the page killed the page preparation process twice")
+                # Every page submitted to the broken pool is lost, resubmit them to a new one
+                retried = deque()
+                for index, (retry_job, retry_pool, retry_future, retry_attempt) in enumerate(pending):
+                    if retry_pool is not pool:
+                        retried.append((retry_job, retry_pool, retry_future, retry_attempt))
+                        continue
+                    if not retry_future.cancel():
+                        retry_future.exception()
+                    # Only the page being waited for counts the attempt, the others may be innocent
+                    retried.append(submit(retry_job, retry_attempt + (index == 0)))
+                pending = retried
+                continue
+            pending.popleft()
+            # Stage timings recorded in the pool processes do not reach this process's metrics
+            if page.text is None:
+                observe_timings(page.timings)
+            yield page
+    finally:
+        for _, _, future, _ in pending:
+            future.cancel()
+
+def iter_prepared_pages(source: FileSource, extraction_request: ExtractionRequest) -> Iterator[PreparedPage]:
+    """Lazily render, resize and encode the pages of a file, releasing each page once encoded.
+
+    PDF pages with a usable text layer are passed as text and never rasterized.
+    """
+    max_edge = extraction_request.image_max_edge or IMAGE_MAX_EDGE
+    is_pdf = get_source_extension(source) == '.pdf'
+    if not (is_pdf and extraction_request.text_fast_path and not extraction_request.stitch_pages):
+        images = get_image_from_file(source, extraction_request.stitch_pages, extraction_request.image_detail, max_edge)
+        try:
+            while (page := prepare_next_page(images, extraction_request)) is not None:
+                yield page
+        finally:
+            images.close()
+        return
+    
+    file_path = get_source_path(source)
+    timings = {}
+    with stage_timer(timings, "text_layer"):
+        texts = extract_pdf_text_pages(file_path, get_page_count(file_path))
+    text_pages = {page_number for page_number, text in enumerate(texts, 1) if has_text_layer(text)}
+    vision_pages = [page_number for page_number in range(1, len(texts) + 1) if page_number not in text_pages]
+    images = convert_pdf_to_images(file_path, False, extraction_request.image_detail, max_edge, vision_pages)
+    try:
+        for page_number, text in enumerate(texts, 1):
+            if page_number not in text_pages:
+                yield prepare_next_page(images, extraction_request)
+            else:
+                page = prepare_text_page(text)
+                # pdftotext reads the whole document at once, its time is shared by the text pages
+                page.timings["text_layer"] = timings["text_layer"] / len(text_pages)
+                yield page
+    finally:
+        images.close()
+
+def create_llm_client(api_config: APIConfig, http_client=None, http_async_client=None):
+    """Create LLM client based on provider, optionally on top of shared HTTP clients"""
     try:
         if api_config.provider.lower() == 'openai':
-            return ChatOpenAI(
+            return langchain_openai.ChatOpenAI(
                 model=api_config.model,
                 api_key=api_config.api_key,
+                base_url=api_config.base_url,
                 max_tokens=api_config.max_tokens,
-                temperature=api_config.temperature
+                temperature=api_config.temperature,
+                # Retries are handled by the rate limit scheduler
+                max_retries=0,
+                http_client=http_client,
+                http_async_client=http_async_client
             )
         elif api_config.provider.lower() == 'azure':
             if not api_config.azure_endpoint or not api_config.azure_deployment or not api_config.api_version:
                 raise ValueError("Azure OpenAI requires endpoint, deployment name, and API version")
             
-            return AzureChatOpenAI(
+            return langchain_openai.AzureChatOpenAI(
                 azure_deployment=api_config.azure_deployment,
                 openai_api_version=api_config.api_version,
                 azure_endpoint=api_config.azure_endpoint,
                 api_key=api_config.api_key,
                 max_tokens=api_config.max_tokens,
-                temperature=api_config.temperature
+                temperature=api_config.temperature,
+                # Retries are handled by the rate limit scheduler
+                max_retries=0,
+                http_client=http_client,
+                http_async_client=http_async_client
             )
         else:
             raise ValueError(f"Unsupported provider: {api_config.provider}")
@@ -100,70 +715,26 @@ def create_llm_client(api_config: APIConfig):
         logger.error(f"Error creating LLM client: {str(e)}")
         raise
 
+def get_llm_client(api_config: APIConfig):
+    """Get a pooled LLM client, reusing connections across pages and requests"""
+    return get_client_registry().get(api_config, create_llm_client)
+
 def create_dynamic_model(schema_definition: Dict[str, Any]) -> BaseModel:
-    """Create a dynamic Pydantic model from schema definition"""
-    try:
-        # Extract field definitions and their types
-        fields = {}
-        for field_name, field_def in schema_definition.items():
-            field_type = field_def.get("type", Any)
-            description = field_def.get("description", "")
-            default = field_def.get("default", ...)
-            
-            # Handle nested properties
-            if "properties" in field_def and isinstance(field_def["properties"], dict):
-                # Create a nested model for this field
-                nested_fields = {}
-                for nested_field_name, nested_field_def in field_def["properties"].items():
-                    nested_field_type = nested_field_def.get("type", Any)
-                    nested_description = nested_field_def.get("description", "")
-                    nested_default = nested_field_def.get("default", ...)
-                    
-                    # Convert string type names to actual types for nested fields
-                    if isinstance(nested_field_type, str):
-                        if nested_field_type.lower() == "string":
-                            nested_field_type = str
-                        elif nested_field_type.lower() in ["int", "integer"]:
-                            nested_field_type = int
-                        elif nested_field_type.lower() in ["float", "number"]:
-                            nested_field_type = float
-                        elif nested_field_type.lower() in ["bool", "boolean"]:
-                            nested_field_type = bool
-                        elif nested_field_type.lower() in ["list", "array"]:
-                            nested_field_type = List[Any]
-                        elif nested_field_type.lower() in ["dict", "object"]:
-                            nested_field_type = Dict[str, Any]
-                    
-                    nested_fields[nested_field_name] = (nested_field_type, Field(nested_default, description=nested_description))
-                
-                # Create the nested model
-                nested_model = create_model(f"{field_name.capitalize()}Model", **nested_fields)
-                
-                # Use the nested model as the field type
-                field_type = nested_model
-            else:
-                # Convert string type names to actual types
-                if isinstance(field_type, str):
-                    if field_type.lower() == "string":
-                        field_type = str
-                    elif field_type.lower() in ["int", "integer"]:
-                        field_type = int
-                    elif field_type.lower() in ["float", "number"]:
-                        field_type = float
-                    elif field_type.lower() in ["bool", "boolean"]:
-                        field_type = bool
-                    elif field_type.lower() in ["list", "array"]:
-                        field_type = List[Any]
-                    elif field_type.lower() in ["dict", "object"]:
-                        field_type = Dict[str, Any]
-            
-            fields[field_name] = (field_type, Field(default, description=description))
-        
-        # Create and return the dynamic model
-        return create_model("DynamicExtractionModel", **fields)
-    except Exception as e:
-        logger.error(f"Error creating dynamic model: {str(e)}")
-        raise
+    """Create a dynamic Pydantic model from schema definition, memoized per schema"""
+    return compile_schema(schema_definition).model
+
+def get_request_template(extraction_request: ExtractionRequest) -> Optional[Template]:
+    """Get the template a request was built from, when it is loaded in this process"""
+    if not extraction_request.template_id:
+        return None
+    return template_registry.peek(extraction_request.template_id)
+
+def get_compiled_schema(extraction_request: ExtractionRequest, schema_definition: Dict[str, Any]) -> CompiledSchema:
+    """Compile a schema, taking the request's own schema from its template when there is one"""
+    template = get_request_template(extraction_request)
+    if template is not None and template.compiled is not None and schema_definition is extraction_request.schema_definition:
+        return template.compiled
+    return compile_schema(schema_definition)
 
 def parse_llm_response(response_text: str) -> Dict[str, Any]:
     """Parse LLM response text to extract JSON"""
@@ -194,162 +765,612 @@ def parse_llm_response(response_text: str) -> Dict[str, Any]:
         logger.error(f"Error parsing LLM response: {str(e)}")
         raise
 
-def extract_from_image(image: Image.Image, extraction_request: ExtractionRequest) -> Tuple[Dict[str, Any], Dict[str, Any]]:
-    """Extract data from image based on schema and prompt"""
-    try:
-        # Convert image to base64
-        base64_image = encode_image_to_base64(image)
-        
-        # Create LLM client
-        chat = create_llm_client(extraction_request.api_config)
-        
-        # Use provided prompt or generate a default one
-        prompt_text = extraction_request.prompt
-        if not prompt_text:
-            # Generate default prompt based on schema if schema is provided
-            if extraction_request.schema_definition:
-                field_descriptions = []
-                for field_name, field_def in extraction_request.schema_definition.items():
-                    description = field_def.get("description", field_name)
-                    field_descriptions.append(f"- {field_name}: {description}")
-                
-                schema_description = "\n".join(field_descriptions)
-                prompt_text = f"""Extract the following information from the image and return it in JSON format:
+def build_prompt_text(extraction_request: ExtractionRequest, source: str = "image") -> str:
+    """Build the extraction prompt from the custom prompt or the schema.
+
+    source names what the model reads from: "image" or "document text".
+    Prompts of template requests are built once per template and source.
+    """
+    template = get_request_template(extraction_request)
+    if template is not None and source in template.prompt_texts:
+        return template.prompt_texts[source]
+    
+    # Use provided prompt or generate a default one
+    prompt_text = extraction_request.prompt
+    if not prompt_text:
+        # Generate default prompt based on schema if schema is provided
+        if extraction_request.schema_definition:
+            schema_description = get_compiled_schema(extraction_request, extraction_request.schema_definition).field_descriptions
+            prompt_text = f"""Extract the following information from the {source} and return it in JSON format:
 
 {schema_description}
 
 Return the data in valid JSON format matching the requested schema.
 """
-            else:
-                # Default prompt if no schema and no custom prompt provided
-                prompt_text = """Extract all relevant information from this image and return it in a structured JSON format.
+        else:
+            # Default prompt if no schema and no custom prompt provided
+            prompt_text = f"""Extract all relevant information from this {source} and return it in a structured JSON format.
 Make sure to include any key details given in the prompt.
 Return your response as valid JSON."""
-            
-            # Truncate if too long
-            if len(prompt_text) > 4000:
-                prompt_text = prompt_text[:3997] + "..."
-        else:
-            prompt_text = "Extract the following information from the image and return it in JSON format: " + prompt_text
-        # Create messages with image
-        messages = [
-            HumanMessage(
-                content=[
-                    {"type": "text", "text": prompt_text},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}",
-                            "detail": "high"
-                        }
+        
+        # Truncate if too long
+        if len(prompt_text) > 4000:
+            prompt_text = prompt_text[:3997] + "..."
+    else:
+        prompt_text = f"Extract the following information from the {source} and return it in JSON format: " + prompt_text
+    if template is not None:
+        template.prompt_texts[source] = prompt_text
+    return prompt_text
+
+def build_messages(prompt_text: str, base64_image: str, detail: str = "high") -> List[langchain_schema.HumanMessage]:
+    """Build the chat messages carrying the prompt and the page image"""
+    return [
+        langchain_schema.HumanMessage(
+            content=[
+                {"type": "text", "text": prompt_text},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64_image}",
+                        "detail": detail
                     }
-                ]
+                }
+            ]
+        )
+    ]
+
+def build_text_messages(prompt_text: str, text: str) -> List[langchain_schema.HumanMessage]:
+    """Build the chat messages carrying the prompt and the page's text layer"""
+    return [langchain_schema.HumanMessage(content=f"{prompt_text}\n\nDocument text:\n{text}")]
+
+def unbilled_usage_metrics(page_metrics: Dict[str, Any], cache_hit: bool = False, deduplicated: bool = False) -> Dict[str, Any]:
+    """Usage metrics of a result that was not paid for by this request"""
+    return {
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "total_cost": 0.0,
+        **page_metrics,
+        "cache_hit": cache_hit,
+        "deduplicated": deduplicated
+    }
+
+def estimate_request_tokens(pages: List[PreparedPage], prompt_text: str, extraction_request: ExtractionRequest) -> int:
+    """Estimate the tokens a call counts against the quota: prompt, images and the completion budget"""
+    # Roughly four characters per token for English text
+    text_tokens = (len(prompt_text) + sum(len(page.text or "") for page in pages)) // 4
+    return text_tokens + sum(page.estimated_image_tokens for page in pages) + extraction_request.api_config.max_tokens
+
+async def aextract_from_image(image: Image.Image, extraction_request: ExtractionRequest) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Extract data from image based on schema and prompt"""
+    # Resize and encode off the event loop, it is CPU bound
+    page = await run_blocking(prepare_page, image, extraction_request)
+    return await aextract_from_page(page, extraction_request)
+
+async def arun_extraction(content_hash: str, prompt_text: str, make_messages: Callable[[], List[langchain_schema.HumanMessage]],
+                          estimated_tokens: int, extraction_request: ExtractionRequest,
+                          schema_definition: Optional[Dict[str, Any]], page_metrics: Dict[str, Any],
+                          timings: Optional[Dict[str, float]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Run one LLM call through the cache, in-flight deduplication and the rate limit scheduler.
+
+    timings holds the seconds already spent preparing the pages and receives the
+    cache, wait, llm and parse stages.
+    """
+    api_config = extraction_request.api_config
+    model_labels = {"provider": api_config.provider.lower(), "model": api_config.azure_deployment or api_config.model}
+    timings = dict(timings or {})
+    
+    # Serve repeated pages from the cache at no cost
+    cache_key = make_cache_key(content_hash, extraction_request, prompt_text)
+    # Reported with the usage, it is the key to pass to the cache invalidation endpoint
+    page_metrics = {**page_metrics, "cache_key": cache_key}
+    use_cache = CACHE_ENABLED and extraction_request.use_cache
+    if use_cache:
+        with stage_timer(timings, "cache"):
+            cached_data = await run_blocking(extraction_cache.get, cache_key)
+        if cached_data is not None:
+            return cached_data, unbilled_usage_metrics({**page_metrics, "timings": round_timings(timings)}, cache_hit=True)
+    
+    async def extract() -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        # Get a pooled LLM client
+        chat = get_llm_client(extraction_request.api_config)
+        messages = make_messages()
+        
+        async def invoke_model():
+            async with get_global_semaphore():
+                with langchain_callbacks.get_openai_callback() as cb:
+                    attempt_timings = {}
+                    try:
+                        if extraction_request.structured_output:
+                            # The provider constrains the reply to JSON
+                            if schema_definition:
+                                compiled = get_compiled_schema(extraction_request, schema_definition)
+                                model = chat.bind(response_format=compiled.response_format)
+                            else:
+                                model = chat.bind(response_format=JSON_OBJECT_FORMAT)
+                        else:
+                            model = chat
+                        with LLM_REQUESTS_IN_FLIGHT.track(**model_labels), stage_timer(attempt_timings, "llm"):
+                            response = await model.ainvoke(messages)
+                        LLM_REQUEST_SECONDS.observe(attempt_timings["llm"], **model_labels)
+                        
+                        with stage_timer(attempt_timings, "parse"):
+                            if extraction_request.structured_output:
+                                # Parsed strictly in one pass
+                                if schema_definition:
+                                    extracted_data = compiled.model.model_validate_json(response.content).model_dump()
+                                else:
+                                    extracted_data = json.loads(response.content)
+                            elif schema_definition:
+                                # If schema is provided, use Pydantic parser
+                                # The compiled model and parser are shared by every page using this schema
+                                extracted_data = get_compiled_schema(extraction_request, schema_definition).parser.parse(response.content).model_dump()
+                            else:
+                                # If no schema, just get raw response and parse it
+                                extracted_data = parse_llm_response(response.content)
+                    except Exception as e:
+                        LLM_ERRORS.inc(**model_labels, error=type(e).__name__)
+                        raise
+                    return extracted_data, cb, attempt_timings
+        
+        # Get response with cost tracking, paced to the provider's rate limits
+        start = time.perf_counter()
+        extracted_data, cb, attempt_timings = await rate_limit_scheduler.run(api_config, estimated_tokens, invoke_model)
+        # Time spent waiting for a slot, the rate limiter or retries
+        record_stage("wait", max(0.0, time.perf_counter() - start - sum(attempt_timings.values())), timings)
+        timings.update(attempt_timings)
+        rate_limit_scheduler.settle(api_config, estimated_tokens, cb.total_tokens)
+        
+        TOKENS.inc(cb.prompt_tokens, **model_labels, kind="prompt")
+        TOKENS.inc(cb.completion_tokens, **model_labels, kind="completion")
+        COST.inc(cb.total_cost, **model_labels)
+        usage_metrics = {
+            "prompt_tokens": cb.prompt_tokens,
+            "completion_tokens": cb.completion_tokens,
+            "total_tokens": cb.total_tokens,
+            "total_cost": round(cb.total_cost, 4),
+            **page_metrics,
+            "timings": round_timings(timings),
+            "cache_hit": False,
+            "deduplicated": False
+        }
+        
+        if use_cache:
+            await run_blocking(extraction_cache.set, cache_key, extracted_data)
+        
+        return extracted_data, usage_metrics
+    
+    # Identical pages already being extracted by another request share that call
+    (extracted_data, usage_metrics), deduplicated = await in_flight_extractions.run(cache_key, extract)
+    if deduplicated:
+        # The cost is attributed to the request that made the call
+        return copy.deepcopy(extracted_data), unbilled_usage_metrics({**page_metrics, "timings": round_timings(timings)}, deduplicated=True)
+    return extracted_data, usage_metrics
+
+def get_field_keys(page: PreparedPage, extraction_request: ExtractionRequest) -> Dict[str, str]:
+    """Get the field store key of every top-level schema field of a page, or none when fields are not reused"""
+    schema_definition = extraction_request.schema_definition
+    if not (schema_definition and FIELD_STORE_ENABLED and CACHE_ENABLED and extraction_request.use_cache):
+        return {}
+    return {
+        field_name: make_field_key(page.content_hash, field_name, field_definition, extraction_request)
+        for field_name, field_definition in schema_definition.items()
+    }
+
+async def aextract_from_page(page: PreparedPage, extraction_request: ExtractionRequest) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Extract data from a prepared page based on schema and prompt.
+
+    Fields already extracted from the same page with the same definition are taken
+    from the field store, and only the missing ones are asked from the model.
+    """
+    try:
+        field_keys = get_field_keys(page, extraction_request)
+        stored_values = await run_blocking(field_store.get_many, list(field_keys.values())) if field_keys else {}
+        stored_fields = {name: stored_values[key] for name, key in field_keys.items() if key in stored_values}
+        page_metrics = {"estimated_image_tokens": page.estimated_image_tokens, "extraction_mode": page.extraction_mode}
+        if field_keys:
+            # Links the fields to this request's cache entry, so invalidating it drops them too
+            cache_key = make_cache_key(page.content_hash, extraction_request, get_page_prompt_text(page, extraction_request))
+        if field_keys and len(stored_fields) == len(field_keys):
+            logger.info(f"Reusing all {len(stored_fields)} stored fields of page")
+            await run_blocking(field_store.set_many, {}, cache_key, field_keys.values())
+            return stored_fields, unbilled_usage_metrics(
+                {**page_metrics, "cache_key": cache_key, "timings": round_timings(page.timings), "reused_fields": list(stored_fields)},
+                cache_hit=True
             )
-        ]
         
-        # Get response with cost tracking
-        usage_metrics = {}
-        with get_openai_callback() as cb:
-            # If schema is provided, use Pydantic parser
-            if extraction_request.schema_definition:
-                dynamic_model = create_dynamic_model(extraction_request.schema_definition)
-                parser = PydanticOutputParser(pydantic_object=dynamic_model)
-                chain = chat | parser
-                response = chain.invoke(messages)
-                extracted_data = response.dict()
-            else:
-                # If no schema, just get raw response and parse it
-                response = chat.invoke(messages)
-                extracted_data = parse_llm_response(response.content)
-            
-            usage_metrics = {
-                "prompt_tokens": cb.prompt_tokens,
-                "completion_tokens": cb.completion_tokens,
-                "total_tokens": cb.total_tokens,
-                "total_cost": round(cb.total_cost, 4)
-            }
+        request = extraction_request
+        if stored_fields:
+            # Ask only for the missing fields, with a model reduced to them
+            missing_schema = {name: definition for name, definition in extraction_request.schema_definition.items()
+                              if name not in stored_fields}
+            logger.info(f"Reusing {len(stored_fields)} stored fields, extracting {', '.join(missing_schema)}")
+            request = extraction_request.model_copy(update={"schema_definition": missing_schema, "template_id": None})
         
+        extracted_data, usage_metrics = await aextract_page_fields(page, request, page_metrics)
+        if field_keys:
+            new_values = {key: extracted_data.get(name) for name, key in field_keys.items() if name not in stored_fields}
+            await run_blocking(field_store.set_many, new_values, cache_key, field_keys.values())
+            # Merged in schema order
+            extracted_data = {name: stored_fields[name] if name in stored_fields else extracted_data.get(name)
+                              for name in field_keys}
+            usage_metrics["reused_fields"] = list(stored_fields)
+            # The fields are linked to the whole request's key, not to the key of the reduced call
+            usage_metrics["cache_key"] = cache_key
         return extracted_data, usage_metrics
 
     except Exception as e:
         logger.error(f"Error extracting from image: {str(e)}")
         raise
 
-def process_file(file_path: str, extraction_request: ExtractionRequest) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
-    """Process a single file and extract data according to the schema"""
+def get_page_prompt_text(page: PreparedPage, extraction_request: ExtractionRequest) -> str:
+    return build_prompt_text(extraction_request, "document text" if page.text is not None else "image")
+
+async def aextract_page_fields(page: PreparedPage, extraction_request: ExtractionRequest,
+                               page_metrics: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Extract the fields of extraction_request's schema from a prepared page, errors are logged by the caller"""
+    prompt_text = get_page_prompt_text(page, extraction_request)
+    if page.text is not None:
+        logger.info(f"Sending text layer of {len(page.text)} characters")
+        make_messages = lambda: build_text_messages(prompt_text, page.text)
+    else:
+        logger.info(f"Sending {page.width}x{page.height} image, estimated {page.estimated_image_tokens} image tokens")
+        make_messages = lambda: build_messages(prompt_text, page.base64_image, extraction_request.image_detail)
+    
+    return await arun_extraction(
+        page.content_hash, prompt_text, make_messages,
+        estimate_request_tokens([page], prompt_text, extraction_request),
+        extraction_request, extraction_request.schema_definition, page_metrics, page.timings
+    )
+
+def fits_in_pack(pack: List[PreparedPage], page: PreparedPage, extraction_request: ExtractionRequest) -> bool:
+    """Check whether a page can join a pack without exceeding the page, token and payload budgets"""
+    if extraction_request.page_packing == PACKING_OFF:
+        return not pack
+    pages = pack + [page]
+    tokens = sum(item.estimated_image_tokens + len(item.text or "") // 4 for item in pages)
+    payload_bytes = sum(len(item.base64_image or item.text or "") for item in pages)
+    return not pack or (
+        len(pages) <= PACK_MAX_PAGES and tokens <= PACK_MAX_TOKENS and payload_bytes <= PACK_MAX_PAYLOAD_MB * 1024 * 1024
+    )
+
+def build_packed_prompt_text(extraction_request: ExtractionRequest) -> str:
+    """Build the prompt of a packed request, asking for a result per page or one for all pages"""
+    if extraction_request.page_packing == PACKING_PER_PAGE:
+        if extraction_request.schema_definition:
+            extraction_request = extraction_request.model_copy(
+                # No longer the template's schema, so its prompt is not reused
+                update={"schema_definition": paginate_schema(extraction_request.schema_definition), "template_id": None}
+            )
+        instructions = ("Return a JSON object with a \"pages\" list holding one entry per page, "
+                        "each with the page_number it was extracted from.")
+    else:
+        instructions = "Combine the information from all pages into a single result."
+    return (build_prompt_text(extraction_request, "document pages") +
+            "\n\nThe document pages follow in order, each preceded by its page number. " + instructions)
+
+def build_packed_messages(prompt_text: str, pages: List[Tuple[int, PreparedPage]], detail: str = "high") -> List[langchain_schema.HumanMessage]:
+    """Build one chat message carrying the prompt and several pages as labelled image or text parts"""
+    content = [{"type": "text", "text": prompt_text}]
+    for page_number, page in pages:
+        if page.text is not None:
+            content.append({"type": "text", "text": f"Page {page_number}:\n{page.text}"})
+        else:
+            content.append({"type": "text", "text": f"Page {page_number}:"})
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{page.base64_image}", "detail": detail}
+            })
+    return [langchain_schema.HumanMessage(content=content)]
+
+def split_packed_result(extracted_data: Dict[str, Any], page_numbers: List[int]) -> List[Optional[Dict[str, Any]]]:
+    """Map a per-page packed result back to one result per page, in page order, None for pages the reply left out"""
+    entries = extracted_data.get("pages") if isinstance(extracted_data, dict) else None
+    results = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            page_number = int(entry.get("page_number"))
+        except (TypeError, ValueError):
+            continue
+        results.setdefault(page_number, {key: value for key, value in entry.items() if key != "page_number"})
+    missing = [page_number for page_number in page_numbers if page_number not in results]
+    if missing:
+        logger.warning(f"Packed response has no entry for pages {missing}, extracting them one by one")
+    return [results.get(page_number) for page_number in page_numbers]
+
+async def aextract_from_pages(pages: List[Tuple[int, PreparedPage]],
+                              extraction_request: ExtractionRequest) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Extract data from several consecutive pages in one request.
+
+    Returns one result per page with page_packing "per_page", where the call's usage
+    is attributed to the first page, or a single result with "per_document". Pages
+    the reply leaves out are extracted again on their own and carry that call's usage.
+    """
     try:
-        # Get images from file
-        images = get_image_from_file(file_path)
+        page_numbers = [page_number for page_number, _ in pages]
+        prepared_pages = [page for _, page in pages]
+        logger.info(f"Sending pages {page_numbers[0]}-{page_numbers[-1]} in one request")
+        prompt_text = build_packed_prompt_text(extraction_request)
+        schema_definition = extraction_request.schema_definition
+        if schema_definition and extraction_request.page_packing == PACKING_PER_PAGE:
+            schema_definition = paginate_schema(schema_definition)
         
-        extracted_data_list = []
-        usage_metrics_list = []
-        total_cost = 0.0
+        content_hash = hashlib.sha256(
+            ":".join([extraction_request.page_packing] + [page.content_hash for page in prepared_pages]).encode("utf-8")
+        ).hexdigest()
+        extracted_data, usage_metrics = await arun_extraction(
+            content_hash, prompt_text,
+            lambda: build_packed_messages(prompt_text, pages, extraction_request.image_detail),
+            estimate_request_tokens(prepared_pages, prompt_text, extraction_request),
+            extraction_request, schema_definition,
+            {
+                "estimated_image_tokens": sum(page.estimated_image_tokens for page in prepared_pages),
+                "extraction_mode": "+".join(sorted({page.extraction_mode for page in prepared_pages})),
+                "packed_pages": page_numbers
+            },
+            sum_timings([page.timings for page in prepared_pages])
+        )
         
-        # Process each page/image
-        for i, image in enumerate(images):
-            logger.info(f"Processing page {i+1}/{len(images)} of {os.path.basename(file_path)}")
-            
-            # Extract data from image
-            extracted_data, usage_metrics = extract_from_image(image, extraction_request)
-            
-            # Add filename and page number to usage metrics
-            usage_metrics["file_name"] = os.path.basename(file_path)
-            usage_metrics["page_number"] = i + 1
+        if extraction_request.page_packing == PACKING_PER_DOCUMENT:
+            return [(extracted_data, usage_metrics)]
+        page_results = split_packed_result(extracted_data, page_numbers)
+        missing = [i for i, page_data in enumerate(page_results) if page_data is None]
+        retried = dict(zip(missing, await asyncio.gather(*(aextract_from_page(prepared_pages[i], extraction_request) for i in missing))))
+        results = []
+        for i, page_data in enumerate(page_results):
+            if i == 0:
+                page_metrics = usage_metrics
+            elif i in retried:
+                page_metrics = retried[i][1]
+            else:
+                page_metrics = unbilled_usage_metrics({
+                    "estimated_image_tokens": 0,
+                    "extraction_mode": usage_metrics["extraction_mode"],
+                    "packed_pages": page_numbers,
+                    "cache_key": usage_metrics["cache_key"],
+                    "timings": {}
+                }, usage_metrics["cache_hit"], usage_metrics["deduplicated"])
+            if i in retried:
+                page_data = retried[i][0]
+                if i == 0:
+                    # The first page carries the packed call, add its own call on top
+                    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                        page_metrics[key] += retried[i][1][key]
+                    page_metrics["total_cost"] = round(page_metrics["total_cost"] + retried[i][1]["total_cost"], 4)
+                page_metrics["missing_from_pack"] = True
+            results.append((page_data, page_metrics))
+        return results
+
+    except Exception as e:
+        logger.error(f"Error extracting from pages: {str(e)}")
+        raise
+
+def extract_from_image(image: Image.Image, extraction_request: ExtractionRequest) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Synchronous wrapper around aextract_from_image"""
+    return run_sync(aextract_from_image(image, extraction_request))
+
+async def aprocess_file(source: FileSource, extraction_request: ExtractionRequest, semaphore: Optional[asyncio.Semaphore] = None,
+                        progress_callback: Optional[ProgressCallback] = None, file_index: int = 0,
+                        retain_data: bool = True) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Process a single file, sending its pages to the LLM concurrently.
+
+    With page_triage, blank and duplicate pages are skipped before the LLM call and listed in
+    the file metadata. progress_callback, when given, receives a "file_started"
+    event, a "page_completed" or "page_skipped" event per page as soon as it is
+    done and a "file_completed" event at the end.
+    With retain_data=False the extracted data is only handed to the callback and
+    the returned list holds None placeholders.
+    """
+    file_name = get_source_name(source)
+    start = time.perf_counter()
+    try:
+        if semaphore is None:
+            semaphore = create_request_semaphore(extraction_request)
+        
+        # Pages are rendered lazily, rasterization is CPU bound so keep it off the loop
+        page_count = await run_blocking(get_page_count, source, extraction_request.stitch_pages)
+        await notify_progress(progress_callback, {
+            "event": "file_started",
+            "file_index": file_index,
+            "file_name": file_name,
+            "page_count": page_count
+        })
+        
+        async def process_pack(pack: List[Tuple[int, PreparedPage]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+            page_numbers = [page_number for page_number, _ in pack]
+            logger.info(f"Processing page {', '.join(map(str, page_numbers))}/{page_count} of {file_name}")
             
-            # Track total cost
-            total_cost += usage_metrics["total_cost"]
+            # Extract data from image, several pages per request when packing
+            if len(pack) == 1:
+                results = [await aextract_from_page(pack[0][1], extraction_request)]
+            else:
+                results = await aextract_from_pages(pack, extraction_request)
             
-            extracted_data_list.append(extracted_data)
-            usage_metrics_list.append(usage_metrics)
+            packed_results = []
+            for (extracted_data, usage_metrics), page_number in zip(results, page_numbers):
+                outcome = "cached" if usage_metrics["cache_hit"] else "deduplicated" if usage_metrics["deduplicated"] else "extracted"
+                PAGES.inc(mode=usage_metrics["extraction_mode"], outcome=outcome)
+                # Add filename and page number to usage metrics
+                usage_metrics["file_name"] = file_name
+                usage_metrics["page_number"] = page_number
+                await notify_progress(progress_callback, {
+                    "event": "page_completed",
+                    "file_index": file_index,
+                    "file_name": file_name,
+                    "page_number": page_number,
+                    "page_count": page_count,
+                    # A per-document result covers every page of its pack
+                    "pages": len(page_numbers) if len(results) == 1 else 1,
+                    "extracted_data": extracted_data,
+                    "usage_metrics": usage_metrics
+                })
+                packed_results.append(((extracted_data if retain_data else None), usage_metrics))
+            return packed_results
+        
+        # Take the next page only once a slot is free, so only the prefetched pages and
+        # one encoded pack per slot are held in memory instead of the whole document
+        pages = aiter_prepared_pages(source, extraction_request)
+        triage = PageTriage()
+        skipped_pages = []
+        tasks = []
+        pack = []
+        page_number = 0
+        holding_slot = False
+        
+        def launch(pack: List[Tuple[int, PreparedPage]]) -> None:
+            task = asyncio.create_task(process_pack(pack))
+            # Released on completion or cancellation, even if the task never started
+            task.add_done_callback(lambda _: semaphore.release())
+            tasks.append(task)
+        
+        try:
+            while not any(task.done() and not task.cancelled() and task.exception() for task in tasks):
+                if not holding_slot:
+                    await semaphore.acquire()
+                    holding_slot = True
+                page = await anext(pages, None)
+                if page is None:
+                    if pack:
+                        launch(pack)
+                        holding_slot = False
+                    break
+                page_number += 1
+                skipped_page = triage.check(page_number, page.signature)
+                if skipped_page is not None:
+                    skipped_page["estimated_image_tokens"] = page.estimated_image_tokens
+                    skipped_page["timings"] = round_timings(page.timings)
+                    skipped_pages.append(skipped_page)
+                    PAGES.inc(mode=page.extraction_mode, outcome="skipped")
+                    logger.info(f"Skipping {skipped_page['reason']} page {page_number}/{page_count} of {file_name}")
+                    await notify_progress(progress_callback, {
+                        "event": "page_skipped",
+                        "file_index": file_index,
+                        "file_name": file_name,
+                        "page_count": page_count,
+                        **skipped_page
+                    })
+                    continue
+                if not fits_in_pack([packed for _, packed in pack], page, extraction_request):
+                    launch(pack)
+                    pack = []
+                    holding_slot = False
+                    await semaphore.acquire()
+                    holding_slot = True
+                pack.append((page_number, page))
+                if extraction_request.page_packing == PACKING_OFF:
+                    launch(pack)
+                    pack = []
+                    holding_slot = False
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            if holding_slot:
+                semaphore.release()
+            await pages.aclose()
+        
+        # Results come back in page order regardless of completion order
+        results = [result for pack_results in await gather_or_cancel(tasks) for result in pack_results]
+        
+        extracted_data_list = [extracted_data for extracted_data, _ in results]
+        usage_metrics_list = [usage_metrics for _, usage_metrics in results]
+        total_cost = sum(usage_metrics["total_cost"] for usage_metrics in usage_metrics_list)
         
         # Create file-level metadata with total cost
         file_metadata = {
-            "file_name": os.path.basename(file_path),
-            "page_count": len(images),
+            "file_name": file_name,
+            "page_count": page_count,
+            # One result per LLM call: fewer than pages when pages are packed or skipped
+            "result_count": len(results),
             "page_metrics": usage_metrics_list,
+            "skipped_pages": skipped_pages,
+            "skipped_image_tokens": sum(skipped_page["estimated_image_tokens"] for skipped_page in skipped_pages),
+            # Seconds per stage summed over pages, plus the file's wall time
+            "timings": {
+                **sum_timings([metrics.get("timings") for metrics in usage_metrics_list + skipped_pages]),
+                "total": round(time.perf_counter() - start, 4)
+            },
             "total_cost": round(total_cost, 4)
         }
-        
-        return extracted_data_list, file_metadata
     except Exception as e:
-        logger.error(f"Error processing file {file_path}: {str(e)}")
-        return [], {"file_name": os.path.basename(file_path), "error": str(e), "total_cost": 0.0}
+        logger.error(f"Error processing file {file_name}: {str(e)}")
+        FILE_ERRORS.inc()
+        extracted_data_list, file_metadata = [], {"file_name": file_name, "error": str(e), "total_cost": 0.0}
+    
+    await notify_progress(progress_callback, {
+        "event": "file_completed",
+        "file_index": file_index,
+        "file_name": file_name,
+        "file_metadata": file_metadata
+    })
+    return extracted_data_list, file_metadata
+
+def process_file(source: FileSource, extraction_request: ExtractionRequest) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Synchronous wrapper around aprocess_file"""
+    return run_sync(aprocess_file(source, extraction_request))
 
-def process_files(file_paths: List[str], extraction_request: ExtractionRequest) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
-    """Process multiple files and extract data according to the schema"""
+async def aprocess_files(sources: List[FileSource], extraction_request: ExtractionRequest,
+                         progress_callback: Optional[ProgressCallback] = None,
+                         retain_data: bool = True) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Process multiple files (paths or ingested uploads) concurrently and extract data according to the schema.
+
+    With retain_data=False pages are only delivered through progress_callback and
+    the returned data list is empty, so callers streaming results never hold the
+    whole result set in memory.
+    """
     all_extracted_data = []
     all_file_metadata = []
+    successful_extractions = 0
     total_cost = 0.0
     
-    for file_path in file_paths:
+    # All files of the request share one page budget
+    semaphore = create_request_semaphore(extraction_request)
+    
+    async def run_file(file_index: int, source: FileSource) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
         try:
-            logger.info(f"Processing {os.path.basename(file_path)}")
-            data_list, file_metadata = process_file(file_path, extraction_request)
-            
-            if data_list:
-                all_extracted_data.extend(data_list)
-                all_file_metadata.append(file_metadata)
-                total_cost += file_metadata.get("total_cost", 0.0)
-            else:
-                logger.warning(f"Failed to process {os.path.basename(file_path)}")
+            logger.info(f"Processing {get_source_name(source)}")
+            return await aprocess_file(source, extraction_request, semaphore, progress_callback, file_index, retain_data)
         except Exception as e:
-            logger.error(f"Error processing {os.path.basename(file_path)}: {str(e)}")
-            all_file_metadata.append({
-                "file_name": os.path.basename(file_path),
+            logger.error(f"Error processing {get_source_name(source)}: {str(e)}")
+            return None, {
+                "file_name": get_source_name(source),
                 "error": str(e),
                 "total_cost": 0.0
-            })
+            }
+    
+    with REQUESTS_IN_FLIGHT.track():
+        results = await asyncio.gather(*(run_file(i, source) for i, source in enumerate(sources)))
+    
+    for source, (data_list, file_metadata) in zip(sources, results):
+        if data_list:
+            successful_extractions += len(data_list)
+            if retain_data:
+                all_extracted_data.extend(data_list)
+            all_file_metadata.append(file_metadata)
+            total_cost += file_metadata.get("total_cost", 0.0)
+        elif data_list is None or "error" not in file_metadata:
+            # Unexpected failures, or files whose pages were all skipped as blank or duplicate
+            all_file_metadata.append(file_metadata)
+        else:
+            logger.warning(f"Failed to process {get_source_name(source)}")
     
     # Create overall metadata with total cost
     overall_metadata = {
         "files": all_file_metadata,
-        "file_count": len(file_paths),
-        "successful_extractions": len(all_extracted_data),
+        "file_count": len(sources),
+        "successful_extractions": successful_extractions,
         "total_cost": round(total_cost, 4)
     }
     
     return all_extracted_data, overall_metadata
 
+def process_files(sources: List[FileSource], extraction_request: ExtractionRequest) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Synchronous wrapper around aprocess_files"""
+    return run_sync(aprocess_files(sources, extraction_request))
+
 # Sample usage:
 """
 # Example 1: Using schema-based extraction
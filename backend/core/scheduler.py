@@ -0,0 +1,198 @@
+from __future__ import annotations
+import asyncio
+import functools
+import hashlib
+import os
+import random
+import threading
+import time
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple, TypeVar, TYPE_CHECKING
+from backend.models.api_models import APIConfig
+from backend.core.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import openai
+else:
+    openai = lazy_module("openai")
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Provider quotas per API key and deployment, 0 for no client-side limit. Requests
+# can override them through api_config.requests_per_minute and tokens_per_minute.
+RATE_LIMIT_RPM = int(os.getenv("EXTRACTOR_RATE_LIMIT_RPM", "0"))
+RATE_LIMIT_TPM = int(os.getenv("EXTRACTOR_RATE_LIMIT_TPM", "0"))
+# Providers enforce quotas over short windows, so only this many seconds of quota may be spent at once
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("EXTRACTOR_RATE_LIMIT_BURST_SECONDS", "10"))
+# Retries of a page after a rate limit or transient provider error
+LLM_MAX_RETRIES = int(os.getenv("EXTRACTOR_LLM_MAX_RETRIES", "6"))
+BACKOFF_BASE_SECONDS = float(os.getenv("EXTRACTOR_BACKOFF_BASE_SECONDS", "1"))
+BACKOFF_MAX_SECONDS = float(os.getenv("EXTRACTOR_BACKOFF_MAX_SECONDS", "60"))
+
+
+T = TypeVar("T")
+RateLimitKey = Tuple[Any, ...]
+
+
+@functools.lru_cache(maxsize=None)
+def get_retryable_errors() -> Tuple[type, ...]:
+    """Get the provider errors worth retrying, importing openai on first use"""
+    return (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def get_rate_limit_key(api_config: APIConfig) -> RateLimitKey:
+    """Identify the quota a config draws from: the API key and the deployment or model"""
+    return (
+        api_config.provider.lower(),
+        api_config.base_url,
+        api_config.azure_endpoint,
+        api_config.azure_deployment or api_config.model,
+        hashlib.sha256(api_config.api_key.encode("utf-8")).hexdigest()
+    )
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Read the delay requested by the provider from the Retry-After headers of an error"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            # HTTP date form
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except Exception:
+        return None
+
+def get_backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter, so pages rejected together do not retry together"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate.
+
+    Reservations are taken immediately and may drive the balance negative; the
+    caller then waits until the debt is repaid. This keeps callers in FIFO order
+    without a queue and works across event loops.
+    """
+
+    def __init__(self, per_minute: int, burst_seconds: float = RATE_LIMIT_BURST_SECONDS):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, per_minute * burst_seconds / 60)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount from the bucket and return how long to wait before using it"""
+        self._refill(now)
+        # A single call larger than the burst is let through once the bucket is full
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount: float, now: float) -> None:
+        """Take (or give back, when negative) the difference between estimated and actual usage"""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def drain(self, seconds: float, now: float) -> None:
+        """Empty the bucket so nothing is sent for the given number of seconds"""
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class RateLimiter:
+    """Request and token buckets of one quota, plus a pause set by the provider's 429s"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.limits = (requests_per_minute, tokens_per_minute)
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        """Wait until a call of estimated_tokens fits both quotas"""
+        with self.lock:
+            now = time.monotonic()
+            delay = max(0.0, self.paused_until - now)
+            if self.requests is not None:
+                delay = max(delay, self.requests.reserve(1, now))
+            if self.tokens is not None:
+                delay = max(delay, self.tokens.reserve(estimated_tokens, now))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token bucket with the usage reported by the provider"""
+        if self.tokens is None or not actual_tokens:
+            return
+        with self.lock:
+            self.tokens.adjust(actual_tokens - estimated_tokens, time.monotonic())
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every call of this quota, after the provider rejected one"""
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.drain(seconds, now)
+
+
+class RateLimitScheduler:
+    """Paces LLM calls to the provider's quotas and retries the calls it rejects"""
+
+    def __init__(self, max_retries: int = LLM_MAX_RETRIES):
+        self.max_retries = max_retries
+        self.limiters: Dict[RateLimitKey, RateLimiter] = {}
+        self.lock = threading.Lock()
+
+    def get_limiter(self, api_config: APIConfig) -> RateLimiter:
+        limits = (api_config.requests_per_minute or RATE_LIMIT_RPM, api_config.tokens_per_minute or RATE_LIMIT_TPM)
+        key = get_rate_limit_key(api_config)
+        with self.lock:
+            limiter = self.limiters.get(key)
+            if limiter is None or limiter.limits != limits:
+                limiter = RateLimiter(*limits)
+                self.limiters[key] = limiter
+            return limiter
+
+    async def run(self, api_config: APIConfig, estimated_tokens: int, call: Callable[[], Awaitable[T]]) -> T:
+        """Run call once the quotas allow it, retrying rate limits and transient errors with backoff"""
+        limiter = self.get_limiter(api_config)
+        attempt = 0
+        while True:
+            await limiter.acquire(estimated_tokens)
+            try:
+                return await call()
+            except Exception as e:
+                if not isinstance(e, get_retryable_errors()) or attempt >= self.max_retries:
+                    raise
+                retry_after = get_retry_after(e)
+                delay = min(BACKOFF_MAX_SECONDS, retry_after) if retry_after is not None else get_backoff_delay(attempt)
+                if isinstance(e, openai.RateLimitError):
+                    # The quota is shared, so every page waits rather than only this one
+                    limiter.pause(delay)
+                attempt += 1
+                logger.warning(f"LLM call failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def settle(self, api_config: APIConfig, estimated_tokens: int, actual_tokens: int) -> None:
+        self.get_limiter(api_config).settle(estimated_tokens, actual_tokens)
+
+rate_limit_scheduler = RateLimitScheduler()
@@ -0,0 +1,204 @@
+from __future__ import annotations
+import hashlib
+import json
+import re
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Any, Optional, Type, TYPE_CHECKING
+from pydantic import BaseModel, Field, create_model
+from backend.core.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import langchain.output_parsers as langchain_output_parsers
+else:
+    langchain_output_parsers = lazy_module("langchain.output_parsers")
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Compiled schemas kept in memory, keyed by the canonical hash of their definition
+SCHEMA_CACHE_SIZE = 256
+
+SCALAR_TYPES = {
+    "str": str,
+    "string": str,
+    "int": int,
+    "integer": int,
+    "float": float,
+    "number": float,
+    "bool": bool,
+    "boolean": bool,
+    "any": Any,
+    "list": List[Any],
+    "array": List[Any],
+    "dict": Dict[str, Any],
+    "object": Dict[str, Any]
+}
+GENERIC_TYPE = re.compile(r"^(list|array|dict|object|optional)\[(.*)\]$", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class CompiledSchema:
+    """Everything derived from a schema definition that can be reused across pages"""
+    schema_hash: str
+    model: Type[BaseModel]
+    parser: langchain_output_parsers.PydanticOutputParser
+    json_schema: Dict[str, Any]
+    field_descriptions: str
+
+    @property
+    def response_format(self) -> Dict[str, Any]:
+        """OpenAI structured-output response format constraining replies to this schema"""
+        # Not strict: strict mode rejects optional fields and defaults, replies are validated on parse instead
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": self.model.__name__, "schema": self.json_schema, "strict": False}
+        }
+
+
+def get_schema_hash(schema_definition: Dict[str, Any]) -> str:
+    """Hash a schema definition independently of its key order"""
+    canonical = json.dumps(schema_definition, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def split_type_arguments(arguments: str) -> List[str]:
+    """Split "str, List[int]" into its top-level comma separated parts"""
+    parts, depth, current = [], 0, ""
+    for char in arguments:
+        if char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+            continue
+        depth += {"[": 1, "]": -1}.get(char, 0)
+        current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+def parse_type_name(type_name: str) -> Tuple[Any, bool]:
+    """Convert a type name such as "List[Optional[float]]" to a type, and whether it is optional"""
+    type_name = type_name.strip()
+    scalar = SCALAR_TYPES.get(type_name.lower())
+    if scalar is not None:
+        return scalar, False
+
+    match = GENERIC_TYPE.match(type_name)
+    if not match:
+        raise ValueError(f"Unsupported type: {type_name}")
+    container, arguments = match.group(1).lower(), split_type_arguments(match.group(2))
+    if container == "optional" and len(arguments) == 1:
+        inner, _ = parse_type_name(arguments[0])
+        return Optional[inner], True
+    if container in ("list", "array") and len(arguments) == 1:
+        return List[parse_type_name(arguments[0])[0]], False
+    if container in ("dict", "object") and len(arguments) == 2:
+        return Dict[parse_type_name(arguments[0])[0], parse_type_name(arguments[1])[0]], False
+    raise ValueError(f"Unsupported type: {type_name}")
+
+def model_name(path: List[str]) -> str:
+    """Build a unique model name from the path of a nested field"""
+    return "".join(part[:1].upper() + part[1:] for part in re.split(r"[^0-9A-Za-z]+", "_".join(path)) if part) + "Model"
+
+def compile_field_type(field_def: Any, path: List[str]) -> Tuple[Any, bool]:
+    """Compile a field definition to a type annotation, and whether the field is optional"""
+    # Shorthand definitions: {"name": "str"}
+    if isinstance(field_def, str):
+        return parse_type_name(field_def)
+    if not isinstance(field_def, dict):
+        raise ValueError(f"Invalid definition for field {'.'.join(path)}")
+
+    optional = bool(field_def.get("optional") or field_def.get("nullable") or field_def.get("required") is False)
+    type_name = field_def.get("type", "any")
+    if not isinstance(type_name, str):
+        raise ValueError(f"Invalid type for field {'.'.join(path)}")
+    base_type_name = type_name.strip().lower()
+
+    if isinstance(field_def.get("properties"), dict):
+        # Nested object, compiled to its own model
+        field_type = compile_model(field_def["properties"], path)
+    elif base_type_name in ("list", "array") and "items" in field_def:
+        # Array whose items have their own definition, e.g. invoice line items
+        item_type, _ = compile_field_type(field_def["items"], path + ["item"])
+        field_type = List[item_type]
+    else:
+        field_type, type_optional = parse_type_name(type_name)
+        optional = optional or type_optional
+        if type_optional:
+            return field_type, True
+
+    return (Optional[field_type] if optional else field_type), optional
+
+def compile_model(fields_definition: Dict[str, Any], path: List[str]) -> Type[BaseModel]:
+    """Recursively compile a mapping of field definitions to a Pydantic model"""
+    fields = {}
+    for field_name, field_def in fields_definition.items():
+        field_type, optional = compile_field_type(field_def, path + [field_name])
+        description = field_def.get("description", "") if isinstance(field_def, dict) else ""
+        if isinstance(field_def, dict) and "default" in field_def:
+            default = field_def["default"]
+        else:
+            default = None if optional else ...
+        fields[field_name] = (field_type, Field(default, description=description))
+    return create_model(model_name(path) if path else "DynamicExtractionModel", **fields)
+
+def describe_fields(fields_definition: Dict[str, Any], indent: str = "") -> List[str]:
+    """List the fields of a schema, nested ones indented under their parent"""
+    lines = []
+    for field_name, field_def in fields_definition.items():
+        field_def = field_def if isinstance(field_def, dict) else {}
+        lines.append(f"{indent}- {field_name}: {field_def.get('description', field_name)}")
+        if isinstance(field_def.get("properties"), dict):
+            lines.extend(describe_fields(field_def["properties"], indent + "  "))
+        elif isinstance(field_def.get("items"), dict) and isinstance(field_def["items"].get("properties"), dict):
+            lines.extend(describe_fields(field_def["items"]["properties"], indent + "  "))
+    return lines
+
+def paginate_schema(schema_definition: Dict[str, Any]) -> Dict[str, Any]:
+    """Wrap a schema so several pages can be extracted at once, one list entry per page"""
+    return {
+        "pages": {
+            "type": "list",
+            "description": "One entry per page",
+            "items": {
+                "properties": {
+                    **schema_definition,
+                    "page_number": {"type": "int", "description": "Number of the page the entry was extracted from"}
+                }
+            }
+        }
+    }
+
+
+_compiled_schemas: "OrderedDict[str, CompiledSchema]" = OrderedDict()
+_compiled_schemas_lock = threading.Lock()
+
+def compile_schema(schema_definition: Dict[str, Any]) -> CompiledSchema:
+    """Compile a schema definition once and reuse the result for every page and request"""
+    schema_hash = get_schema_hash(schema_definition)
+    with _compiled_schemas_lock:
+        compiled = _compiled_schemas.get(schema_hash)
+        if compiled is not None:
+            _compiled_schemas.move_to_end(schema_hash)
+            return compiled
+
+    try:
+        model = compile_model(schema_definition, [])
+        compiled = CompiledSchema(
+            schema_hash=schema_hash,
+            model=model,
+            parser=langchain_output_parsers.PydanticOutputParser(pydantic_object=model),
+            json_schema=model.model_json_schema(),
+            field_descriptions="\n".join(describe_fields(schema_definition))
+        )
+    except Exception as e:
+        logger.error(f"Error compiling schema: {str(e)}")
+        raise
+
+    with _compiled_schemas_lock:
+        _compiled_schemas[schema_hash] = compiled
+        while len(_compiled_schemas) > SCHEMA_CACHE_SIZE:
+            _compiled_schemas.popitem(last=False)
+    return compiled
@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Directory holding the local SQLite stores and job uploads. Point it at persistent
+# storage so jobs survive restarts; workers on the same host can share it. It holds
+# uploaded documents and extraction results, so it must only be accessible to its owner.
+DATA_DIR = os.getenv(
+    "EXTRACTOR_DATA_DIR",
+    os.path.join(tempfile.gettempdir(), f"document-extractor-{os.getuid()}" if hasattr(os, "getuid") else "document-extractor")
+)
+
+_data_dir_checked = False
+_data_dir_lock = threading.Lock()
+
+
+def ensure_data_dir() -> None:
+    """Create the data directory private to this user, refusing one that another user owns"""
+    global _data_dir_checked
+    if _data_dir_checked:
+        return
+    with _data_dir_lock:
+        if _data_dir_checked:
+            return
+        os.makedirs(DATA_DIR, mode=0o700, exist_ok=True)
+        if hasattr(os, "getuid"):
+            # lstat, so a symlink planted in place of the directory is not followed
+            info = os.lstat(DATA_DIR)
+            if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+                raise PermissionError(f"Data directory {DATA_DIR} is not a directory owned by the current user")
+            if stat.S_IMODE(info.st_mode) & 0o077:
+                logger.warning(f"Restricting permissions of data directory {DATA_DIR} to its owner")
+                os.chmod(DATA_DIR, 0o700)
+        _data_dir_checked = True
+
+def data_path(*parts: str) -> str:
+    """Get a path inside the data directory, creating parent directories as needed"""
+    ensure_data_dir()
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    return path
+
+def connect(db_name: str) -> sqlite3.Connection:
+    """Open a connection to a SQLite database in the data directory"""
+    try:
+        path = data_path(db_name)
+        if not os.path.exists(path):
+            # SQLite gives its -wal and -shm files the permissions of the database
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+        connection = sqlite3.connect(path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        # WAL lets several worker processes read while one writes
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+    except Exception as e:
+        logger.error(f"Error opening database {db_name}: {str(e)}")
+        raise
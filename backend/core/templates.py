@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from contextlib import closing
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional
+from backend.core.schema import CompiledSchema, compile_schema, get_schema_hash
+from backend.core.storage import connect
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DB = "templates.sqlite3"
+# Templates kept loaded, with their compiled schema, per worker process
+TEMPLATE_CACHE_SIZE = 256
+
+
+@dataclass
+class Template:
+    """A saved prompt and schema, compiled once per process when first used"""
+    id: str
+    name: str
+    prompt: Optional[str]
+    schema_definition: Optional[Dict[str, Any]]
+    schema_hash: Optional[str]
+    created_at: float
+    compiled: Optional[CompiledSchema] = field(default=None, repr=False, compare=False)
+    # Prompt texts generated for this template, per source ("image", "document text", ...)
+    prompt_texts: Dict[str, str] = field(default_factory=dict, repr=False, compare=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "template_id": self.id,
+            "name": self.name,
+            "prompt": self.prompt,
+            "schema_definition": self.schema_definition,
+            "schema_hash": self.schema_hash,
+            "created_at": self.created_at
+        }
+
+
+class TemplateStore:
+    """SQLite-backed persistence for extraction templates, shared by the workers of a host"""
+
+    def __init__(self, db_name: str = TEMPLATES_DB):
+        self.db_name = db_name
+        with closing(connect(self.db_name)) as connection, connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS templates (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    prompt TEXT,
+                    schema_definition TEXT,
+                    schema_hash TEXT,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    def _execute(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        with closing(connect(self.db_name)) as connection, connection:
+            return [dict(row) for row in connection.execute(query, params).fetchall()]
+
+    @staticmethod
+    def _to_template(row: Dict[str, Any]) -> Template:
+        schema_definition = json.loads(row["schema_definition"]) if row["schema_definition"] else None
+        return Template(row["id"], row["name"], row["prompt"], schema_definition, row["schema_hash"], row["created_at"])
+
+    def create(self, template: Template) -> None:
+        self._execute(
+            "INSERT INTO templates (id, name, prompt, schema_definition, schema_hash, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (template.id, template.name, template.prompt,
+             json.dumps(template.schema_definition) if template.schema_definition else None,
+             template.schema_hash, template.created_at)
+        )
+
+    def get(self, template_id: str) -> Optional[Template]:
+        rows = self._execute("SELECT * FROM templates WHERE id = ?", (template_id,))
+        return self._to_template(rows[0]) if rows else None
+
+    def exists(self, template_id: str) -> bool:
+        return bool(self._execute("SELECT 1 FROM templates WHERE id = ?", (template_id,)))
+
+    def list(self) -> List[Template]:
+        return [self._to_template(row) for row in self._execute("SELECT * FROM templates ORDER BY created_at")]
+
+    def delete(self, template_id: str) -> bool:
+        with closing(connect(self.db_name)) as connection, connection:
+            return connection.execute("DELETE FROM templates WHERE id = ?", (template_id,)).rowcount > 0
+
+
+class TemplateRegistry:
+    """Creates, looks up and deletes templates, keeping the ones in use compiled in memory.
+
+    Templates never change once created, so a loaded template stays valid for as
+    long as its row exists; lookups only check the row is still there.
+    """
+
+    def __init__(self, store: Optional[TemplateStore] = None, cache_size: int = TEMPLATE_CACHE_SIZE):
+        self._store = store
+        self.cache_size = cache_size
+        self.loaded: "OrderedDict[str, Template]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def store(self) -> TemplateStore:
+        if self._store is None:
+            self._store = TemplateStore()
+        return self._store
+
+    def _load(self, template: Template) -> Template:
+        """Compile a template's schema and keep it loaded"""
+        if template.schema_definition:
+            template.compiled = compile_schema(template.schema_definition)
+        with self.lock:
+            self.loaded[template.id] = template
+            while len(self.loaded) > self.cache_size:
+                self.loaded.popitem(last=False)
+        return template
+
+    def create(self, name: str, prompt: Optional[str], schema_definition: Optional[Dict[str, Any]]) -> Template:
+        """Validate, compile and save a template; raises ValueError for an invalid schema"""
+        template = Template(
+            id=uuid.uuid4().hex,
+            name=name,
+            prompt=prompt or None,
+            schema_definition=schema_definition or None,
+            schema_hash=get_schema_hash(schema_definition) if schema_definition else None,
+            created_at=time.time()
+        )
+        try:
+            self._load(template)
+        except Exception as e:
+            raise ValueError(f"Invalid schema_definition: {str(e)}")
+        self.store.create(template)
+        return template
+
+    def get(self, template_id: str) -> Optional[Template]:
+        """Get a template, compiled, or None when it does not exist"""
+        with self.lock:
+            template = self.loaded.get(template_id)
+            if template is not None:
+                self.loaded.move_to_end(template_id)
+        if template is not None:
+            # Another worker may have deleted it
+            if self.store.exists(template_id):
+                return template
+            self.forget(template_id)
+            return None
+        template = self.store.get(template_id)
+        return self._load(template) if template is not None else None
+
+    def peek(self, template_id: str) -> Optional[Template]:
+        """Get a template only if it is already loaded in this process, without touching the store"""
+        with self.lock:
+            return self.loaded.get(template_id)
+
+    def list(self) -> List[Template]:
+        return self.store.list()
+
+    def delete(self, template_id: str) -> bool:
+        self.forget(template_id)
+        return self.store.delete(template_id)
+
+    def forget(self, template_id: str) -> None:
+        with self.lock:
+            self.loaded.pop(template_id, None)
+
+template_registry = TemplateRegistry()
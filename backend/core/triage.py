@@ -0,0 +1,105 @@
+from __future__ import annotations
+import hashlib
+import os
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Any, Optional, TYPE_CHECKING
+from backend.core.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import numpy as np
+    from PIL import Image
+else:
+    np = lazy_module("numpy")
+    Image = lazy_module("PIL.Image")
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# A page is blank when it has no more ink than a few specks of dust, or when it is a perfectly
+# flat tone. Both thresholds sit well below a page holding a single line of text (an A4 page
+# at 300 DPI with one line is about 0.0007 ink and a standard deviation of 5), since a
+# wrongly skipped page silently loses data. Set both to 0 to keep every page.
+BLANK_INK_LEVEL = int(os.getenv("EXTRACTOR_BLANK_INK_LEVEL", "160"))
+BLANK_MAX_INK_RATIO = float(os.getenv("EXTRACTOR_BLANK_MAX_INK_RATIO", "0.00002"))
+BLANK_MAX_STD = float(os.getenv("EXTRACTOR_BLANK_MAX_STD", "1"))
+# Pages are duplicates when their pixels are identical to an earlier page of the same file
+SKIP_DUPLICATE_PAGES = os.getenv("EXTRACTOR_SKIP_DUPLICATE_PAGES", "1") == "1"
+# Pages whose difference hash (HASH_SIZE x HASH_SIZE bits) differs from an earlier page of
+# the same file by at most this many bits are duplicates too, 0 to only skip identical pages.
+# Perceptual hashes cannot tell apart pages that share a layout, such as the pages of a
+# statement, so only raise it for files that repeat rescanned or re-rendered pages.
+DUPLICATE_HASH_SIZE = int(os.getenv("EXTRACTOR_DUPLICATE_HASH_SIZE", "16"))
+DUPLICATE_MAX_DISTANCE = int(os.getenv("EXTRACTOR_DUPLICATE_MAX_DISTANCE", "0"))
+
+BLANK = "blank"
+DUPLICATE = "duplicate"
+
+
+@dataclass
+class PageSignature:
+    """Cheap statistics of a rasterized page used to skip it before the LLM call"""
+    ink_ratio: float
+    std: float
+    pixel_digest: str
+    perceptual_hash: int
+
+    @property
+    def blank(self) -> bool:
+        return self.ink_ratio < BLANK_MAX_INK_RATIO or self.std < BLANK_MAX_STD
+
+
+def pixel_digest(gray: Image.Image) -> str:
+    """Digest of a page's size and gray pixels, equal only for identical pages"""
+    digest = hashlib.sha256(f"{gray.width}x{gray.height}".encode("utf-8"))
+    digest.update(gray.tobytes())
+    return digest.hexdigest()
+
+def difference_hash(gray: Image.Image, hash_size: int = DUPLICATE_HASH_SIZE) -> int:
+    """Perceptual difference hash: whether each pixel of a tiny thumbnail is brighter than its right neighbour"""
+    pixels = np.asarray(gray.resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def analyze_page(image: Image.Image) -> PageSignature:
+    """Compute the ink density, tone variance, pixel digest and perceptual hash of a page"""
+    gray = image if image.mode == "L" else image.convert("L")
+    try:
+        pixels = np.asarray(gray)
+        return PageSignature(
+            ink_ratio=float(np.count_nonzero(pixels < BLANK_INK_LEVEL)) / max(1, pixels.size),
+            std=float(pixels.std()),
+            pixel_digest=pixel_digest(gray),
+            perceptual_hash=difference_hash(gray)
+        )
+    finally:
+        if gray is not image:
+            gray.close()
+
+
+class PageTriage:
+    """Decides which pages of one file are worth sending to the model"""
+
+    def __init__(self):
+        # Page number of every page kept so far, by pixel digest
+        self.kept: Dict[str, int] = {}
+        # Perceptual hash and page number of every page kept so far
+        self.kept_hashes: List[Tuple[int, int]] = []
+
+    def check(self, page_number: int, signature: Optional[PageSignature]) -> Optional[Dict[str, Any]]:
+        """Return why the page should be skipped, or None to extract it"""
+        if signature is None:
+            # Text-layer pages are not rasterized and always kept
+            return None
+        if signature.blank:
+            return {"page_number": page_number, "reason": BLANK}
+        if SKIP_DUPLICATE_PAGES and signature.pixel_digest in self.kept:
+            return {"page_number": page_number, "reason": DUPLICATE, "duplicate_of": self.kept[signature.pixel_digest]}
+        if DUPLICATE_MAX_DISTANCE > 0:
+            for perceptual_hash, kept_page_number in self.kept_hashes:
+                if (perceptual_hash ^ signature.perceptual_hash).bit_count() <= DUPLICATE_MAX_DISTANCE:
+                    return {"page_number": page_number, "reason": DUPLICATE, "duplicate_of": kept_page_number}
+        self.kept.setdefault(signature.pixel_digest, page_number)
+        self.kept_hashes.append((signature.perceptual_hash, page_number))
+        return None
@@ -1,15 +1,40 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+import os
 import logging
+from contextlib import asynccontextmanager
 from backend.routes.router import router
+from backend.core.runner import run_blocking, shutdown_blocking_executor, start_render_pool, shutdown_render_pool
+from backend.core.lazy import warm_up
+from backend.core.jobs import job_manager
+from backend.core.clients import close_client_registry
+from backend.core.metrics import registry
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Heavy dependencies (langchain, openai, PIL, numpy) are imported on first use. Set to 1
+# to import them during startup instead, so the first request does not pay for it.
+WARMUP = os.getenv("EXTRACTOR_WARMUP", "0") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the job workers and release worker resources when the server shuts down"""
+    await run_blocking(start_render_pool, WARMUP)
+    if WARMUP:
+        await run_blocking(warm_up)
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+    await close_client_registry()
+    shutdown_blocking_executor()
+    shutdown_render_pool()
+
 # Create FastAPI app
 app = FastAPI(
+    lifespan=lifespan,
     title="Document Extraction API",
     description="API for extracting structured data from documents using LLMs",
     version="1.0.0"
@@ -32,5 +57,11 @@ app.include_router(router, prefix="/api")
 async def root():
     return {"message": "Document Extraction API is running. Visit /docs for API documentation."}
 
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=True)
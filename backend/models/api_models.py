@@ -1,10 +1,11 @@
 from pydantic import BaseModel, Field, create_model
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Literal
 class APIConfig(BaseModel):
     """Configuration for API credentials"""
     provider: str = Field(..., description="API provider: 'openai' or 'azure'")
     api_key: str = Field(..., description="API key for authentication")
     model: str = Field("gpt-4o", description="Model to use for extraction")
+    base_url: Optional[str] = Field(None, description="Base URL of an OpenAI-compatible endpoint, defaults to the OpenAI API")
     # Azure specific fields
     api_version: Optional[str] = Field(None, description="API version for Azure")
     azure_endpoint: Optional[str] = Field(None, description="Azure endpoint URL")
@@ -12,14 +13,57 @@ class APIConfig(BaseModel):
     # Common parameters
     max_tokens: int = Field(2048, description="Maximum tokens for completion")
     temperature: float = Field(0.3, description="Temperature for generation")
+    # Provider quota, used to pace calls instead of running into 429s
+    requests_per_minute: Optional[int] = Field(None, ge=1, description="Requests per minute allowed for this API key and deployment")
+    tokens_per_minute: Optional[int] = Field(None, ge=1, description="Tokens per minute allowed for this API key and deployment")
 
 class ExtractionRequest(BaseModel):
     """Request model for extraction"""
     api_config: APIConfig
     prompt: Optional[str] = Field(None, description="Custom prompt limited to 4000 characters")
     schema_definition: Optional[Dict[str, Any]] = Field(None, description="Pydantic schema definition")
+    template_id: Optional[str] = Field(None, description="Saved template the prompt and schema definition were taken from")
+    max_concurrency: Optional[int] = Field(None, ge=1, description="Maximum number of pages sent to the LLM concurrently for this request")
+    stitch_pages: bool = Field(False, description="Stitch all PDF pages into one size-capped image instead of extracting page by page")
+    image_detail: Literal["high", "low"] = Field("high", description="Vision detail level: 'high' for tiled full detail, 'low' for a flat-cost 512px image")
+    image_max_edge: Optional[int] = Field(None, ge=64, description="Maximum image edge in pixels sent to the model, defaults to the model limit")
+    jpeg_quality: Optional[int] = Field(None, ge=1, le=95, description="JPEG quality used to encode images")
+    text_fast_path: bool = Field(True, description="Send PDF pages with a usable text layer as text instead of images")
+    page_triage: bool = Field(False, description="Skip blank and identical duplicate pages before sending them to the LLM")
+    page_packing: Literal["off", "per_page", "per_document"] = Field("off", description="Send consecutive pages in one request, returning a result per page or one per document")
+    structured_output: bool = Field(False, description="Use the provider's structured output (JSON schema or JSON mode) and parse the reply strictly")
+    use_cache: bool = Field(True, description="Reuse cached results for pages already extracted with the same settings")
     
 class ExtractResponse(BaseModel):
     """Response model for extraction endpoints"""
     data: Any = Field(..., description="Extracted data")
-    usage: Dict[str, Any] = Field(..., description="Extraction metadata including cost and file information")
\ No newline at end of file
+    usage: Dict[str, Any] = Field(..., description="Extraction metadata including cost and file information")
+
+class TemplateCreateRequest(BaseModel):
+    """Request model for saving an extraction template"""
+    name: str = Field(..., min_length=1, description="Display name of the template")
+    prompt: Optional[str] = Field(None, description="Custom prompt limited to 4000 characters")
+    schema_definition: Optional[Dict[str, Any]] = Field(None, description="Pydantic schema definition")
+
+class TemplateResponse(BaseModel):
+    """Response model for a saved extraction template"""
+    template_id: str = Field(..., description="Identifier passed as template_id to the extraction endpoints")
+    name: str = Field(..., description="Display name of the template")
+    prompt: Optional[str] = Field(None, description="Custom prompt")
+    schema_definition: Optional[Dict[str, Any]] = Field(None, description="Pydantic schema definition")
+    schema_hash: Optional[str] = Field(None, description="Hash of the schema definition")
+    created_at: float = Field(..., description="Creation time as a UNIX timestamp")
+
+class JobSubmitResponse(BaseModel):
+    """Response model for job submission"""
+    job_id: str = Field(..., description="Identifier used to poll the job")
+    status: str = Field(..., description="Job status: 'queued', 'running', 'completed' or 'failed'")
+
+class JobStatusResponse(BaseModel):
+    """Response model for job status polling"""
+    job_id: str = Field(..., description="Job identifier")
+    status: str = Field(..., description="Job status: 'queued', 'running', 'completed' or 'failed'")
+    created_at: float = Field(..., description="Submission time as a UNIX timestamp")
+    updated_at: float = Field(..., description="Last update time as a UNIX timestamp")
+    progress: Dict[str, Any] = Field(..., description="Per-file and per-page progress")
+    error: Optional[str] = Field(None, description="Error message if the job failed")
@@ -1,17 +1,28 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Depends, Query, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Dict, Any, Optional, AsyncIterator, Literal
+import functools
+import hmac
 import json
 import os
-from pydantic import BaseModel, Field
+import asyncio
+from pydantic import BaseModel, Field, ValidationError
 import tempfile
 import shutil
 import logging
 import traceback
 from backend.core.runner import (
-    process_files
+    aprocess_files
+)
+from backend.core.cache import extraction_cache, in_flight_extractions
+from backend.core.fields import field_store
+from backend.core.ingest import Upload, ingest_upload, UPLOAD_SPOOL_MAX_BYTES
+from backend.core.templates import template_registry
+from backend.core.jobs import job_manager, create_upload_dir, QUEUED, RUNNING, COMPLETED, FAILED
+from backend.models.api_models import (
+    APIConfig, ExtractionRequest, ExtractResponse, JobSubmitResponse, JobStatusResponse, TemplateCreateRequest, TemplateResponse
 )
-from backend.models.api_models import APIConfig, ExtractionRequest, ExtractResponse
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -19,11 +30,63 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Maximum number of extraction requests one worker process holds in flight.
+# Requests above the limit are rejected with 503 instead of queueing unbounded work.
+MAX_INFLIGHT_REQUESTS = int(os.getenv("EXTRACTOR_MAX_INFLIGHT_REQUESTS", "8"))
+SUPPORTED_EXTENSIONS = ['.pdf', '.jpg', '.jpeg', '.png']
+# Admin endpoints require this value in the X-Admin-Token header, and are disabled when it is unset
+ADMIN_TOKEN = os.getenv("EXTRACTOR_ADMIN_TOKEN")
 
+_inflight_requests = 0
 
-@router.post("/extract/files", response_model=ExtractResponse)
-async def extract_from_files(
-    files: List[UploadFile] = File(...),
+def acquire_inflight_slot() -> None:
+    """Take an in-flight slot, rejecting the request when none is free"""
+    global _inflight_requests
+    if _inflight_requests >= MAX_INFLIGHT_REQUESTS:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many extraction requests in flight, retry later",
+            headers={"Retry-After": "5"}
+        )
+    _inflight_requests += 1
+
+def release_inflight_slot() -> None:
+    """Give back an in-flight slot"""
+    global _inflight_requests
+    _inflight_requests -= 1
+
+async def limit_inflight_requests():
+    """Hold an in-flight slot for the duration of the request"""
+    acquire_inflight_slot()
+    try:
+        yield
+    finally:
+        release_inflight_slot()
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Guard admin endpoints with the configured admin token, hiding them when none is configured"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def save_uploads(files: List[UploadFile], upload_dir: str, spool_max_bytes: int = UPLOAD_SPOOL_MAX_BYTES) -> List[Upload]:
+    """Ingest supported uploads, keeping small ones in memory and spilling the rest to upload_dir"""
+    uploads = []
+    
+    # Check file types and ingest valid files
+    for index, file in enumerate(files):
+        file_ext = os.path.splitext(file.filename)[1].lower()
+        if file_ext not in SUPPORTED_EXTENSIONS:
+            logger.warning(f"Skipping unsupported file type: {file.filename}")
+            continue
+        
+        upload = ingest_upload(file.file, file.filename, upload_dir, index, spool_max_bytes)
+        uploads.append(upload)
+        logger.info(f"Received file for processing: {upload.file_name} ({upload.size} bytes, {'on disk' if upload.path else 'in memory'})")
+    return uploads
+
+async def get_extraction_request(
     api_provider: str = Form(...),
     api_key: str = Form(...),
     model: str = Form("gpt-4o"),
@@ -31,15 +94,41 @@ async def extract_from_files(
     temperature: float = Form(0.3),
     prompt: Optional[str] = Form(None),
     schema_definition: Optional[str] = Form(None),
+    template_id: Optional[str] = Form(None),
     api_version: Optional[str] = Form(None),
     azure_endpoint: Optional[str] = Form(None),
     azure_deployment: Optional[str] = Form(None),
-    background_tasks: BackgroundTasks = BackgroundTasks()
-):
-    """Extract data from multiple files using the provided schema"""
+    requests_per_minute: Optional[int] = Form(None),
+    tokens_per_minute: Optional[int] = Form(None),
+    max_concurrency: Optional[int] = Form(None),
+    stitch_pages: bool = Form(False),
+    image_detail: Literal["high", "low"] = Form("high"),
+    image_max_edge: Optional[int] = Form(None),
+    jpeg_quality: Optional[int] = Form(None),
+    text_fast_path: bool = Form(True),
+    page_triage: bool = Form(False),
+    page_packing: Literal["off", "per_page", "per_document"] = Form("off"),
+    structured_output: bool = Form(False),
+    use_cache: bool = Form(True)
+) -> ExtractionRequest:
+    """Build the extraction request from the form fields shared by the extraction endpoints"""
+    if template_id:
+        # Saved templates are parsed and compiled once, not on every request
+        if prompt or schema_definition:
+            raise HTTPException(status_code=400, detail="Send either template_id or prompt and schema_definition, not both")
+        template = await run_in_threadpool(template_registry.get, template_id)
+        if template is None:
+            raise HTTPException(status_code=404, detail=f"Template {template_id} not found")
+        prompt, schema_def = template.prompt, template.schema_definition
+    else:
+        try:
+            # Parse schema definition if provided
+            schema_def = json.loads(schema_definition) if schema_definition else None
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid schema_definition JSON: {str(e)}")
+    
+    # Out of range form values are reported like any other invalid field, not as a 500
     try:
-        # Parse schema definition if provided
-        schema_def = json.loads(schema_definition) if schema_definition else None
         # Create API config
         api_config = APIConfig(
             provider=api_provider,
@@ -49,48 +138,255 @@ async def extract_from_files(
             temperature=temperature,
             api_version=api_version,
             azure_endpoint=azure_endpoint,
-            azure_deployment=azure_deployment
+            azure_deployment=azure_deployment,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute
         )
         
         # Create extraction request
-        extraction_request = ExtractionRequest(
+        return ExtractionRequest(
             api_config=api_config,
             prompt=prompt,
-            schema_definition=schema_def
+            schema_definition=schema_def,
+            template_id=template_id,
+            max_concurrency=max_concurrency,
+            stitch_pages=stitch_pages,
+            image_detail=image_detail,
+            image_max_edge=image_max_edge,
+            jpeg_quality=jpeg_quality,
+            text_fast_path=text_fast_path,
+            page_triage=page_triage,
+            page_packing=page_packing,
+            structured_output=structured_output,
+            use_cache=use_cache
         )
-        
-        # Create temp directory
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+
+@router.post("/extract/files", response_model=ExtractResponse)
+async def extract_from_files(
+    files: List[UploadFile] = File(...),
+    extraction_request: ExtractionRequest = Depends(get_extraction_request),
+    background_tasks: BackgroundTasks = BackgroundTasks(),
+    _inflight_slot: None = Depends(limit_inflight_requests)
+):
+    """Extract data from multiple files using the provided schema"""
+    try:
+        # Create temp directory and clean it up in background once the response is sent
         temp_dir = tempfile.mkdtemp()
-        file_paths = []
+        background_tasks.add_task(shutil.rmtree, temp_dir, ignore_errors=True)
         
-        # Check file types and save valid files to temp location
-        supported_extensions = ['.pdf', '.jpg', '.jpeg', '.png']
-        for file in files:
-            file_ext = os.path.splitext(file.filename)[1].lower()
-            if file_ext not in supported_extensions:
-                logger.warning(f"Skipping unsupported file type: {file.filename}")
-                continue
-                
-            temp_file_path = os.path.join(temp_dir, file.filename)
-            with open(temp_file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            file_paths.append(temp_file_path)
-            logger.info(f"Saved file for processing: {file.filename}")
+        # Read uploads on the threadpool so the event loop keeps serving other requests
+        uploads = await run_in_threadpool(save_uploads, files, temp_dir)
         
-        if not file_paths:
+        if not uploads:
             raise HTTPException(status_code=400, detail="No valid PDF or image files were uploaded")
         
         # Process files
-        data, usage = process_files(file_paths, extraction_request)
+        data, usage = await aprocess_files(uploads, extraction_request)
         
-        # Clean up temp files in background
-        background_tasks.add_task(shutil.rmtree, temp_dir)
         return ExtractResponse(data=data, usage=usage)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in extract_from_files at line {traceback.extract_tb(e.__traceback__)}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+# Events buffered for a streaming client; a slower reader holds back the extraction
+# instead of having every page result queued in memory
+STREAM_BUFFER_EVENTS = int(os.getenv("EXTRACTOR_STREAM_BUFFER_EVENTS", "16"))
+
+def encode_stream_event(event: Dict[str, Any], stream_format: str) -> str:
+    """Serialize a stream event as an NDJSON line or a Server-Sent Event"""
+    if stream_format == "sse":
+        return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    return json.dumps(event) + "\n"
+
+async def stream_extraction(uploads: List[Upload], temp_dir: str, extraction_request: ExtractionRequest,
+                            stream_format: str) -> AsyncIterator[str]:
+    """Run the extraction and yield each page as soon as it finishes, then a summary"""
+    events: asyncio.Queue = asyncio.Queue(maxsize=max(1, STREAM_BUFFER_EVENTS))
+    
+    async def on_progress(event: Dict[str, Any]) -> None:
+        if event["event"] == "page_completed":
+            await events.put({
+                "event": "page",
+                "file_index": event["file_index"],
+                "file_name": event["file_name"],
+                "page_number": event["page_number"],
+                "page_count": event["page_count"],
+                "extracted_data": event["extracted_data"],
+                "usage_metrics": event["usage_metrics"]
+            })
+        elif event["event"] == "file_completed":
+            await events.put({
+                "event": "file",
+                "file_index": event["file_index"],
+                "file_name": event["file_name"],
+                "file_metadata": event["file_metadata"]
+            })
+    
+    async def run_extraction() -> Any:
+        """Run the extraction, then tell the reader the stream is over"""
+        try:
+            result = await aprocess_files(uploads, extraction_request, on_progress, retain_data=False)
+        except asyncio.CancelledError:
+            # Only cancelled once the reader is gone
+            raise
+        except Exception:
+            await events.put(None)
+            raise
+        await events.put(None)
+        return result
+    
+    task = asyncio.create_task(run_extraction())
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield encode_stream_event(event, stream_format)
+        
+        try:
+            _, usage = task.result()
+            yield encode_stream_event({"event": "summary", "usage": usage}, stream_format)
+        except Exception as e:
+            logger.error(f"Error in streamed extraction: {str(e)}")
+            yield encode_stream_event({"event": "error", "detail": str(e)}, stream_format)
+    finally:
+        # Stop work when the client disconnects before the end of the stream. This then runs
+        # in a cancelled scope where any await is cancelled too, so the slot is released first
+        # and the uploads are removed in the background.
+        task.cancel()
+        release_inflight_slot()
+        asyncio.get_running_loop().run_in_executor(None, functools.partial(shutil.rmtree, temp_dir, ignore_errors=True))
+
+@router.post("/extract/files/stream")
+async def extract_from_files_stream(
+    files: List[UploadFile] = File(...),
+    extraction_request: ExtractionRequest = Depends(get_extraction_request),
+    format: str = Query("ndjson", description="Stream format: 'ndjson' or 'sse'")
+):
+    """Extract data from multiple files, streaming each page's result as soon as it is ready.
+
+    Emits a "page" event per page, a "file" event with the file metadata when a file
+    is done and a final "summary" event carrying the overall metadata.
+    """
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported stream format: {format}")
+    
+    # The slot is held until the stream ends, so it is released by the stream itself
+    acquire_inflight_slot()
+    temp_dir = tempfile.mkdtemp()
+    try:
+        uploads = await run_in_threadpool(save_uploads, files, temp_dir)
+        if not uploads:
+            raise HTTPException(status_code=400, detail="No valid PDF or image files were uploaded")
+    except Exception:
+        await run_in_threadpool(shutil.rmtree, temp_dir, ignore_errors=True)
+        release_inflight_slot()
+        raise
+    
+    return StreamingResponse(
+        stream_extraction(uploads, temp_dir, extraction_request, format),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/jobs", response_model=JobSubmitResponse, status_code=202)
+async def submit_job(
+    files: List[UploadFile] = File(...),
+    extraction_request: ExtractionRequest = Depends(get_extraction_request)
+):
+    """Queue an extraction job and return its id without waiting for the result"""
+    upload_dir = await run_in_threadpool(create_upload_dir)
+    # Jobs outlive the request, so every upload is written to the job's directory
+    uploads = await run_in_threadpool(save_uploads, files, upload_dir, 0)
+    if not uploads:
+        await run_in_threadpool(shutil.rmtree, upload_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="No valid PDF or image files were uploaded")
+    
+    job_id = await job_manager.submit([upload.path for upload in uploads], upload_dir, extraction_request)
+    return JobSubmitResponse(job_id=job_id, status=QUEUED)
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    """Report the status and per-file, per-page progress of a job"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JobStatusResponse(
+        job_id=job["id"],
+        status=job["status"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        progress=job["progress"],
+        error=job["error"]
+    )
+
+@router.get("/jobs/{job_id}/result", response_model=ExtractResponse)
+async def get_job_result(job_id: str):
+    """Return the result of a completed job"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}")
+    return ExtractResponse(**job["result"])
+
+@router.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    """Delete a job, its result and any remaining uploads"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job["status"] == RUNNING:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is running")
+    await job_manager.delete(job_id)
+    return {"job_id": job_id, "deleted": True}
+
+@router.post("/templates", response_model=TemplateResponse, status_code=201)
+async def create_template(template_request: TemplateCreateRequest):
+    """Save a prompt and schema as a template, compiling the schema once"""
+    try:
+        template = await run_in_threadpool(
+            template_registry.create, template_request.name, template_request.prompt, template_request.schema_definition
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return TemplateResponse(**template.to_dict())
+
+@router.get("/templates", response_model=List[TemplateResponse])
+async def list_templates():
+    """List the saved templates, oldest first"""
+    templates = await run_in_threadpool(template_registry.list)
+    return [TemplateResponse(**template.to_dict()) for template in templates]
+
+@router.delete("/templates/{template_id}")
+async def delete_template(template_id: str):
+    """Delete a saved template"""
+    if not await run_in_threadpool(template_registry.delete, template_id):
+        raise HTTPException(status_code=404, detail=f"Template {template_id} not found")
+    return {"template_id": template_id, "deleted": True}
+
+@router.get("/admin/cache", dependencies=[Depends(require_admin)])
+async def get_cache_stats():
+    """Report extraction cache, field store and in-flight deduplication statistics"""
+    stats = await run_in_threadpool(extraction_cache.stats)
+    stats["fields"] = await run_in_threadpool(field_store.stats)
+    stats["single_flight"] = in_flight_extractions.stats()
+    return stats
+
+@router.delete("/admin/cache", dependencies=[Depends(require_admin)])
+async def invalidate_cache(key: Optional[str] = Query(None, description="Cache key to remove, removes everything when omitted")):
+    """Invalidate one extraction cache entry, or the whole cache, along with the stored fields served under it"""
+    removed = await run_in_threadpool(extraction_cache.invalidate, key)
+    return {"removed": removed, "removed_fields": await run_in_threadpool(field_store.invalidate, key)}
+
 """
 Sample request body for /extract/files endpoint:
 
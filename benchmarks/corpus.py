@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import random
+from typing import Dict, List, Any
+from PIL import Image, ImageDraw
+
+# A4 at 150 DPI for generated pages, 600 DPI for large scans
+PAGE_SIZE = (1240, 1754)
+SCAN_SIZE = (4960, 7016)
+MANIFEST = "manifest.json"
+
+WORDS = ("invoice total amount due date vendor customer item quantity price tax subtotal "
+         "payment terms account number reference order shipping address description").split()
+
+
+def draw_page(rng: random.Random, size=PAGE_SIZE, title: str = "INVOICE") -> Image.Image:
+    """Draw a document-like page: a header, lines of text and a line item table"""
+    width, height = size
+    scale = width / PAGE_SIZE[0]
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    margin = int(80 * scale)
+    line_height = int(28 * scale)
+    draw.rectangle([margin, margin, width - margin, margin + int(60 * scale)], outline="black", width=max(1, int(3 * scale)))
+    draw.text((margin + 20, margin + 20), f"{title} #{rng.randint(1000, 9999)}", fill="black")
+
+    y = margin + int(100 * scale)
+    for _ in range(rng.randint(8, 14)):
+        draw.text((margin, y), " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))), fill="black")
+        y += line_height
+
+    # Line item table
+    y += line_height
+    rows = rng.randint(5, 15)
+    columns = [margin, int(width * 0.5), int(width * 0.65), int(width * 0.8), width - margin]
+    for row in range(rows + 1):
+        draw.line([margin, y + row * line_height, width - margin, y + row * line_height], fill="black")
+        if row < rows:
+            for left, right in zip(columns, columns[1:]):
+                text = rng.choice(WORDS) if left == margin else f"{rng.uniform(1, 500):.2f}"
+                draw.text((left + 8, y + row * line_height + 6), text, fill="black")
+    for x in columns:
+        draw.line([x, y, x, y + rows * line_height], fill="black")
+    return image
+
+def add_scan_noise(image: Image.Image, rng: random.Random) -> Image.Image:
+    """Give a page the slight rotation and gray background of a scanner"""
+    image = image.rotate(rng.uniform(-1.0, 1.0), expand=False, fillcolor=(235, 235, 230))
+    return Image.blend(image, Image.new("RGB", image.size, (240, 238, 232)), 0.15)
+
+def generate_corpus(directory: str, images: int = 20, pdfs: int = 5, pdf_pages: int = 10,
+                    scans: int = 3, seed: int = 0) -> List[Dict[str, Any]]:
+    """Write single-page images, multi-page PDFs and large scans, returning the manifest entries"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    entries = []
+
+    for i in range(images):
+        path = os.path.join(directory, f"page-{i:03d}.png")
+        draw_page(rng).save(path, optimize=True)
+        entries.append({"path": path, "kind": "image", "pages": 1})
+
+    for i in range(pdfs):
+        path = os.path.join(directory, f"document-{i:03d}.pdf")
+        pages = [draw_page(rng, title="STATEMENT") for _ in range(pdf_pages)]
+        pages[0].save(path, save_all=True, append_images=pages[1:], resolution=150)
+        entries.append({"path": path, "kind": "pdf", "pages": pdf_pages})
+
+    for i in range(scans):
+        path = os.path.join(directory, f"scan-{i:03d}.jpg")
+        add_scan_noise(draw_page(rng, size=SCAN_SIZE, title="RECEIPT"), rng).save(path, quality=90)
+        entries.append({"path": path, "kind": "scan", "pages": 1})
+
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump({"seed": seed, "files": entries}, f, indent=2)
+    return entries
+
+def load_corpus(directory: str) -> List[Dict[str, Any]]:
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return json.load(f)["files"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a benchmark corpus")
+    parser.add_argument("directory")
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--pdfs", type=int, default=5)
+    parser.add_argument("--pdf-pages", type=int, default=10)
+    parser.add_argument("--scans", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    entries = generate_corpus(args.directory, args.images, args.pdfs, args.pdf_pages, args.scans, args.seed)
+    print(f"Wrote {len(entries)} files to {args.directory}")
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Stand-in for the OpenAI chat completions endpoint, configured through the environment
+MOCK_LATENCY_SECONDS = float(os.getenv("MOCK_LATENCY_SECONDS", "0.5"))
+MOCK_JITTER_SECONDS = float(os.getenv("MOCK_JITTER_SECONDS", "0.2"))
+MOCK_ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", "0"))
+MOCK_RATE_LIMIT_RATE = float(os.getenv("MOCK_RATE_LIMIT_RATE", "0"))
+MOCK_RETRY_AFTER_MS = int(os.getenv("MOCK_RETRY_AFTER_MS", "500"))
+
+# Image tokens billed per image, as for a high detail page
+IMAGE_TOKENS = 765
+PAGE_LABEL = re.compile(r"^Page (\d+):")
+
+app = FastAPI(title="Mock OpenAI API")
+
+
+def new_stats():
+    return {"requests": 0, "completed": 0, "errors": 0, "rate_limited": 0, "images": 0,
+            "bytes_received": 0, "in_flight": 0, "max_in_flight": 0}
+
+stats = new_stats()
+
+
+def build_reply(body: dict) -> dict:
+    """Build a plausible extraction result, one entry per page for packed per-page requests"""
+    content = body["messages"][0]["content"]
+    parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+    prompt = parts[0].get("text", "")
+    pages = [int(match.group(1)) for part in parts if part.get("type") == "text"
+             for match in [PAGE_LABEL.match(part["text"])] if match]
+    result = {"vendor_name": "ACME Corp", "invoice_number": "INV-0001", "total_amount": 1234.5, "date": "2024-01-31"}
+    if pages and '"pages" list' in prompt:
+        return {"pages": [{"page_number": page_number, **result} for page_number in pages]}
+    return result
+
+def count_prompt_tokens(body: dict) -> int:
+    content = body["messages"][0]["content"]
+    parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+    text_tokens = sum(len(part.get("text", "")) for part in parts) // 4
+    return text_tokens + IMAGE_TOKENS * sum(1 for part in parts if part.get("type") == "image_url")
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    raw = await request.body()
+    body = json.loads(raw)
+    stats["requests"] += 1
+    stats["bytes_received"] += len(raw)
+
+    if random.random() < MOCK_RATE_LIMIT_RATE:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            status_code=429, headers={"retry-after-ms": str(MOCK_RETRY_AFTER_MS)}
+        )
+
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(max(0.0, MOCK_LATENCY_SECONDS + random.uniform(-MOCK_JITTER_SECONDS, MOCK_JITTER_SECONDS)))
+    finally:
+        stats["in_flight"] -= 1
+
+    if random.random() < MOCK_ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse({"error": {"message": "Internal server error", "type": "server_error"}}, status_code=500)
+
+    content = body["messages"][0]["content"]
+    if isinstance(content, list):
+        stats["images"] += sum(1 for part in content if part.get("type") == "image_url")
+    prompt_tokens = count_prompt_tokens(body)
+    reply = json.dumps(build_reply(body))
+    completion_tokens = len(reply) // 4
+    stats["completed"] += 1
+    return {
+        "id": f"chatcmpl-{stats['requests']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens}
+    }
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+@app.delete("/stats")
+async def reset_stats():
+    stats.update(new_stats())
+    return stats
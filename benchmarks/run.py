@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+import httpx
+
+# Run from the repository root: python -m benchmarks.run
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "document-extractor-benchmark-corpus")
+DEFAULT_SCHEMA = {
+    "vendor_name": {"type": "string", "description": "Name of the vendor"},
+    "invoice_number": {"type": "string", "description": "Invoice number"},
+    "total_amount": {"type": "float", "description": "Total amount due"},
+    "date": {"type": "string", "description": "Invoice date"}
+}
+# Metrics compared against the baseline, and whether higher is better
+COMPARED_METRICS = {
+    "pages_per_second": True,
+    "latency_p50": False,
+    "latency_p95": False,
+    "latency_p99": False,
+    "peak_rss_mb": False,
+    "uploaded_mb": False
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the extraction pipeline against a local mock OpenAI server")
+    corpus = parser.add_argument_group("corpus")
+    corpus.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    corpus.add_argument("--regenerate", action="store_true", help="Generate the corpus even if it exists")
+    corpus.add_argument("--images", type=int, default=20, help="Single-page images")
+    corpus.add_argument("--pdfs", type=int, default=5, help="Multi-page PDFs")
+    corpus.add_argument("--pdf-pages", type=int, default=10, help="Pages per PDF")
+    corpus.add_argument("--scans", type=int, default=3, help="Large 600 DPI scans")
+    server = parser.add_argument_group("mock server")
+    server.add_argument("--latency", type=float, default=0.5, help="Mean reply latency in seconds")
+    server.add_argument("--jitter", type=float, default=0.2, help="Latency jitter in seconds")
+    server.add_argument("--error-rate", type=float, default=0.0, help="Share of calls failing with a 500")
+    server.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of calls rejected with a 429")
+    server.add_argument("--port", type=int, default=0, help="Port of the mock server, a free one by default")
+    run = parser.add_argument_group("run")
+    run.add_argument("--max-concurrency", type=int, default=None, help="Pages in flight per request")
+    run.add_argument("--image-detail", choices=["high", "low"], default="high")
+    run.add_argument("--page-packing", choices=["off", "per_page", "per_document"], default="off")
+    run.add_argument("--structured-output", action="store_true")
+    output = parser.add_argument_group("output")
+    output.add_argument("--save-baseline", metavar="PATH", help="Write the results to a baseline JSON file")
+    output.add_argument("--compare", metavar="PATH", help="Compare the results with a baseline JSON file")
+    return parser.parse_args()
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_mock_server(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    """Start the mock server in its own process so it does not weigh on the measurements"""
+    env = {
+        **os.environ,
+        "MOCK_LATENCY_SECONDS": str(args.latency),
+        "MOCK_JITTER_SECONDS": str(args.jitter),
+        "MOCK_ERROR_RATE": str(args.error_rate),
+        "MOCK_RATE_LIMIT_RATE": str(args.rate_limit_rate)
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.mock_server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats").raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Mock server did not start")
+
+def ensure_corpus(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Generate the corpus in a separate process, so its memory is not counted in the peak RSS"""
+    manifest = os.path.join(args.corpus_dir, "manifest.json")
+    if args.regenerate or not os.path.exists(manifest):
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.corpus", args.corpus_dir, "--images", str(args.images),
+             "--pdfs", str(args.pdfs), "--pdf-pages", str(args.pdf_pages), "--scans", str(args.scans)],
+            cwd=REPO_ROOT, check=True
+        )
+    with open(manifest) as f:
+        files = json.load(f)["files"]
+    if not shutil.which("pdftoppm"):
+        print("poppler is not installed, skipping PDFs")
+        files = [entry for entry in files if entry["kind"] != "pdf"]
+    return files
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))], 4)
+
+def get_peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024), 1)
+
+def get_render_pool_peak_rss_mb() -> Optional[float]:
+    """Peak RSS summed over the render pool processes, which RUSAGE_SELF does not count.
+
+    Read from /proc while the pool is alive, None where it is not available.
+    """
+    total_kb = 0
+    for process in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{process.pid}/status") as f:
+                total_kb += next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        except (OSError, StopIteration):
+            return None
+    return round(total_kb / 1024, 1)
+
+async def run_benchmark(files: List[Dict[str, Any]], args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    # Imported here so the data directory is configured first
+    from backend.core.runner import aprocess_files, shutdown_render_pool
+    from backend.models.api_models import APIConfig, ExtractionRequest
+
+    extraction_request = ExtractionRequest(
+        api_config=APIConfig(provider="openai", api_key="sk-benchmark", model="gpt-4o", base_url=base_url),
+        schema_definition=DEFAULT_SCHEMA,
+        max_concurrency=args.max_concurrency,
+        image_detail=args.image_detail,
+        page_packing=args.page_packing,
+        structured_output=args.structured_output,
+        use_cache=False
+    )
+    page_latencies = []
+    pack_latencies = {}
+
+    async def on_progress(event: Dict[str, Any]) -> None:
+        if event["event"] == "page_completed":
+            usage_metrics = event["usage_metrics"]
+            latency = sum(usage_metrics.get("timings", {}).values())
+            packed_pages = usage_metrics.get("packed_pages")
+            if packed_pages:
+                # Only the first page of a pack carries its timings, every page of it waited for the whole pack
+                latency = pack_latencies.setdefault((event["file_index"], packed_pages[0]), latency)
+            # A per-document result stands for every page of its pack
+            page_latencies.extend([latency] * event.get("pages", 1))
+
+    start = time.perf_counter()
+    _, usage = await aprocess_files([entry["path"] for entry in files], extraction_request, on_progress, retain_data=False)
+    elapsed = time.perf_counter() - start
+    render_pool_rss_mb = get_render_pool_peak_rss_mb()
+    shutdown_render_pool()
+
+    file_latencies = [metadata["timings"]["total"] for metadata in usage["files"] if "timings" in metadata]
+    pages = sum(entry["pages"] for entry in files)
+    return {
+        "files": len(files),
+        "pages": pages,
+        "pages_extracted": len(page_latencies),
+        "failed_files": sum(1 for metadata in usage["files"] if "error" in metadata) + len(files) - len(usage["files"]),
+        "elapsed_seconds": round(elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 3),
+        "latency_p50": percentile(page_latencies, 50),
+        "latency_p95": percentile(page_latencies, 95),
+        "latency_p99": percentile(page_latencies, 99),
+        "file_latency_p50": percentile(file_latencies, 50),
+        "file_latency_p95": percentile(file_latencies, 95),
+        "render_pool_peak_rss_mb": render_pool_rss_mb,
+        "total_cost": usage["total_cost"]
+    }
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print(f"\nCompared with baseline from {baseline.get('created_at', 'unknown')}:")
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        current, previous = results["results"].get(metric), baseline["results"].get(metric)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous * 100
+        better = change > 0 if higher_is_better else change < 0
+        verdict = "better" if better else "worse" if change else "same"
+        print(f"  {metric:<18} {previous:>10} -> {current:<10} {change:+.1f}% ({verdict})")
+
+def main() -> None:
+    args = parse_args()
+    os.environ.setdefault("EXTRACTOR_DATA_DIR", tempfile.mkdtemp(prefix="document-extractor-benchmark-"))
+    files = ensure_corpus(args)
+
+    port = args.port or get_free_port()
+    server = start_mock_server(args, port)
+    try:
+        base_url = f"http://127.0.0.1:{port}/v1"
+        results = asyncio.run(run_benchmark(files, args, base_url))
+        server_stats = httpx.get(f"http://127.0.0.1:{port}/stats").json()
+    finally:
+        server.terminate()
+        server.wait()
+
+    results.update({
+        # The benchmark process plus its render pool processes, rasterization happens in the latter
+        "peak_rss_mb": round(get_peak_rss_mb() + (results["render_pool_peak_rss_mb"] or 0), 1),
+        "uploaded_mb": round(server_stats["bytes_received"] / (1024 * 1024), 2),
+        "llm_requests": server_stats["requests"],
+        "rate_limited": server_stats["rate_limited"],
+        "server_errors": server_stats["errors"],
+        "max_in_flight": server_stats["max_in_flight"]
+    })
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("save_baseline", "compare", "port")},
+        "results": results
+    }
+    print(json.dumps(report["results"], indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+
+if __name__ == "__main__":
+    main()
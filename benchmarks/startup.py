@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Tuple
+import httpx
+from benchmarks.run import REPO_ROOT, get_free_port
+
+# Run from the repository root: python -m benchmarks.startup
+APP_MODULE = "backend.main"
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure how long the API process takes to import and to start serving")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to report")
+    parser.add_argument("--skip-server", action="store_true", help="Only measure imports, do not start uvicorn")
+    parser.add_argument("--output", metavar="PATH", help="Write the report to a JSON file")
+    return parser.parse_args()
+
+def get_env(**overrides: str) -> Dict[str, str]:
+    return {**os.environ, "PYTHONPATH": REPO_ROOT, "EXTRACTOR_DATA_DIR": tempfile.mkdtemp(prefix="document-extractor-startup-"), **overrides}
+
+def measure_import() -> Tuple[float, List[Tuple[str, float, float]]]:
+    """Import the app in a fresh interpreter, returning its import seconds and every module's self and cumulative seconds"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {APP_MODULE}"],
+        cwd=REPO_ROOT, env=get_env(), capture_output=True, text=True, check=True
+    )
+    modules = []
+    total = 0.0
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        modules.append((name, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+        if name == APP_MODULE:
+            total = int(cumulative_us) / 1e6
+    return total, modules
+
+def measure_deferred_imports() -> Dict[str, float]:
+    """Seconds each lazily loaded dependency takes to import on first use"""
+    result = subprocess.run(
+        [sys.executable, "-c", f"import json, {APP_MODULE}; from backend.core.lazy import warm_up; print(json.dumps(warm_up()))"],
+        cwd=REPO_ROOT, env=get_env(), capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def measure_server_start(warmup: bool) -> float:
+    """Start uvicorn and return the seconds until it answers the root endpoint"""
+    port = get_free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{APP_MODULE}:app", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=get_env(EXTRACTOR_WARMUP="1" if warmup else "0")
+    )
+    try:
+        deadline = start + 120
+        while time.perf_counter() < deadline:
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/").raise_for_status()
+                return time.perf_counter() - start
+            except httpx.HTTPError:
+                time.sleep(0.02)
+        raise RuntimeError("API server did not start")
+    finally:
+        process.terminate()
+        process.wait()
+
+def median_seconds(values: List[float]) -> float:
+    return round(statistics.median(values), 4)
+
+def main() -> None:
+    args = parse_args()
+    import_runs = [measure_import() for _ in range(args.repeats)]
+    import_seconds = [total for total, _ in import_runs]
+    # Module timings are reported from the median run
+    _, modules = sorted(import_runs, key=lambda run: run[0])[len(import_runs) // 2]
+    slowest = sorted((module for module in modules if module[0] != APP_MODULE), key=lambda module: module[2], reverse=True)
+
+    results: Dict[str, Any] = {
+        "import_seconds_p50": median_seconds(import_seconds),
+        "import_seconds_min": round(min(import_seconds), 4),
+        "slowest_imports": [
+            {"module": name, "self_seconds": round(self_seconds, 4), "cumulative_seconds": round(cumulative_seconds, 4)}
+            for name, self_seconds, cumulative_seconds in slowest[:args.top]
+        ],
+        "deferred_imports_seconds": measure_deferred_imports()
+    }
+    if not args.skip_server:
+        results["server_ready_seconds_p50"] = median_seconds([measure_server_start(False) for _ in range(args.repeats)])
+        results["server_ready_warmup_seconds_p50"] = median_seconds([measure_server_start(True) for _ in range(args.repeats)])
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {"repeats": args.repeats},
+        "results": results
+    }
+    print(json.dumps(report["results"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,9 @@
+const API_BASE_URL = 'http://localhost:8000/api';
+
+// Templates saved on the server, by id, and the one currently loaded in the editor
+let savedTemplates = {};
+let loadedTemplate = null;
+
 document.addEventListener('DOMContentLoaded', function() {
     // Initialize Monaco Editor for JSON Schema
     require.config({ paths: { 'vs': 'https://cdn.jsdelivr.net/npm/monaco-editor@0.43.0/min/vs' }});
@@ -204,23 +210,29 @@ async function extractData() {
     }
     
     // Add other form fields
-    formData.append('prompt', document.getElementById('promptInput').value);
     formData.append('api_provider', document.getElementById('apiProvider').value);
     formData.append('api_key', document.getElementById('apiKey').value);
     formData.append('model', document.getElementById('model').value);
     formData.append('temperature', document.getElementById('temperature').value);
     formData.append('max_tokens', document.getElementById('maxTokens').value);
     
-    // Add schema definition (optional)
-    try {
-        const schemaValue = window.schemaEditor.getValue();
-        if (schemaValue && schemaValue.trim() !== '') {
-            const parsedSchema = JSON.parse(schemaValue);
-            formData.append('schema_definition', JSON.stringify(parsedSchema));
+    if (isTemplateUnchanged()) {
+        // The server already holds the compiled prompt and schema of saved templates
+        formData.append('template_id', loadedTemplate.id);
+    } else {
+        formData.append('prompt', document.getElementById('promptInput').value);
+        
+        // Add schema definition (optional)
+        try {
+            const schemaValue = window.schemaEditor.getValue();
+            if (schemaValue && schemaValue.trim() !== '') {
+                const parsedSchema = JSON.parse(schemaValue);
+                formData.append('schema_definition', JSON.stringify(parsedSchema));
+            }
+        } catch (error) {
+            alert('Invalid schema JSON: ' + error.message);
+            return;
         }
-    } catch (error) {
-        alert('Invalid schema JSON: ' + error.message);
-        return;
     }
     
     // Add Azure-specific fields if needed
@@ -235,7 +247,7 @@ async function extractData() {
     document.getElementById('extractBtn').innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Processing...';
     
     try {
-        const response = await fetch('http://localhost:8000/api/extract/files', {
+        const response = await fetch(`${API_BASE_URL}/extract/files/stream`, {
             method: 'POST',
             body: formData
         });
@@ -244,8 +256,7 @@ async function extractData() {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        const data = await response.json();
-        displayResults(data);
+        await readExtractionStream(response);
     } catch (error) {
         alert('Error extracting data: ' + error.message);
     } finally {
@@ -255,6 +266,53 @@ async function extractData() {
     }
 }
 
+// Read the NDJSON extraction stream, showing each page as soon as it arrives
+async function readExtractionStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const pages = [];
+    const failedFiles = new Set();
+    let buffer = '';
+    
+    const handleEvent = (event) => {
+        if (event.event === 'page') {
+            pages.push(event);
+            document.getElementById('resultsSection').style.display = 'flex';
+            document.getElementById('resultsJson').textContent = JSON.stringify(sortedPageData(pages, failedFiles), null, 2);
+            document.getElementById('extractBtn').innerHTML = `<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Processing... (${pages.length} pages done)`;
+        } else if (event.event === 'file') {
+            if (event.file_metadata.error) {
+                failedFiles.add(event.file_index);
+            }
+        } else if (event.event === 'summary') {
+            displayResults({ data: sortedPageData(pages, failedFiles), usage: event.usage });
+        } else if (event.event === 'error') {
+            throw new Error(event.detail);
+        }
+    };
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim() !== '').forEach(line => handleEvent(JSON.parse(line)));
+    }
+    if (buffer.trim() !== '') {
+        handleEvent(JSON.parse(buffer));
+    }
+}
+
+// Order streamed pages by file and page number, dropping pages of failed files
+function sortedPageData(pages, failedFiles) {
+    return pages
+        .filter(page => !failedFiles.has(page.file_index))
+        .sort((a, b) => a.file_index - b.file_index || a.page_number - b.page_number)
+        .map(page => page.extracted_data);
+}
+
 // Display extraction results
 function displayResults(data) {
     // Show results section
@@ -278,7 +336,7 @@ function displayResults(data) {
             metricsHtml += `
                 <div class="usage-metric">
                     <span class="usage-metric-label">Page ${metric.page_number}</span>
-                    <span>${metric.total_tokens} tokens ($${metric.total_cost.toFixed(4)})</span>
+                    <span>${metric.total_tokens} tokens ($${metric.total_cost.toFixed(4)})${metric.cache_hit ? ' (cached)' : ''}</span>
                 </div>
             `;
         });
@@ -334,8 +392,8 @@ function showSaveTemplateModal() {
     modal.show();
 }
 
-// Save template to local storage
-function saveTemplate() {
+// Save template on the server
+async function saveTemplate() {
     const templateName = document.getElementById('templateName').value.trim();
     
     if (!templateName) {
@@ -343,20 +401,30 @@ function saveTemplate() {
         return;
     }
     
-    const templates = JSON.parse(localStorage.getItem('extractionTemplates') || '{}');
-    
-    templates[templateName] = {
-        prompt: document.getElementById('promptInput').value,
-        schema: window.schemaEditor.getValue()
-    };
+    let schemaDefinition = null;
+    try {
+        const schemaValue = window.schemaEditor.getValue();
+        if (schemaValue && schemaValue.trim() !== '') {
+            schemaDefinition = JSON.parse(schemaValue);
+        }
+    } catch (error) {
+        alert('Invalid schema JSON: ' + error.message);
+        return;
+    }
     
-    localStorage.setItem('extractionTemplates', JSON.stringify(templates));
+    try {
+        const template = await createTemplate(templateName, document.getElementById('promptInput').value, schemaDefinition);
+        loadedTemplate = { id: template.template_id, prompt: document.getElementById('promptInput').value, schema: window.schemaEditor.getValue() };
+    } catch (error) {
+        alert('Error saving template: ' + error.message);
+        return;
+    }
     
     // Close modal
     bootstrap.Modal.getInstance(document.getElementById('saveTemplateModal')).hide();
     
     // Refresh templates list
-    loadSavedTemplates();
+    await loadSavedTemplates();
     
     // Clear template name input
     document.getElementById('templateName').value = '';
@@ -365,33 +433,77 @@ function saveTemplate() {
     alert(`Template "${templateName}" saved successfully with both prompt and schema.`);
 }
 
-// Load saved templates from local storage
-function loadSavedTemplates() {
+async function createTemplate(name, prompt, schemaDefinition) {
+    const response = await fetch(`${API_BASE_URL}/templates`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ name: name, prompt: prompt || null, schema_definition: schemaDefinition })
+    });
+    if (!response.ok) {
+        const error = await response.json().catch(() => ({}));
+        throw new Error(error.detail || `HTTP error! status: ${response.status}`);
+    }
+    return response.json();
+}
+
+// Move templates saved in this browser by earlier versions to the server
+async function migrateLocalTemplates() {
+    const templates = JSON.parse(localStorage.getItem('extractionTemplates') || '{}');
+    for (const [name, template] of Object.entries(templates)) {
+        try {
+            await createTemplate(name, template.prompt, template.schema ? JSON.parse(template.schema) : null);
+            delete templates[name];
+        } catch (error) {
+            console.warn(`Could not move template "${name}" to the server: ${error.message}`);
+        }
+    }
+    if (Object.keys(templates).length === 0) {
+        localStorage.removeItem('extractionTemplates');
+    } else {
+        localStorage.setItem('extractionTemplates', JSON.stringify(templates));
+    }
+}
+
+// Load saved templates from the server
+async function loadSavedTemplates() {
     const templatesList = document.getElementById('savedTemplatesList');
-    templatesList.innerHTML = '';
     
-    const templates = JSON.parse(localStorage.getItem('extractionTemplates') || '{}');
+    try {
+        if (localStorage.getItem('extractionTemplates')) {
+            await migrateLocalTemplates();
+        }
+        const response = await fetch(`${API_BASE_URL}/templates`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        savedTemplates = Object.fromEntries((await response.json()).map(template => [template.template_id, template]));
+    } catch (error) {
+        console.error('Error loading templates: ' + error.message);
+        return;
+    }
     
-    Object.keys(templates).forEach(name => {
+    templatesList.innerHTML = '';
+    Object.values(savedTemplates).forEach(template => {
         const templateItem = document.createElement('li');
         templateItem.className = 'nav-item';
         templateItem.innerHTML = `
             <div class="template-item">
-                <span class="template-name">${name}</span>
+                <span class="template-name"></span>
                 <span class="template-info text-muted small ms-2">(prompt + schema)</span>
                 <span class="delete-template text-danger"><i class="bi bi-trash"></i></span>
             </div>
         `;
+        templateItem.querySelector('.template-name').textContent = template.name;
         
         // Load template on click
         templateItem.querySelector('.template-name').addEventListener('click', function() {
-            loadTemplate(name);
+            loadTemplate(template.template_id);
         });
         
         // Delete template
         templateItem.querySelector('.delete-template').addEventListener('click', function(e) {
             e.stopPropagation();
-            deleteTemplate(name);
+            deleteTemplate(template.template_id);
         });
         
         templatesList.appendChild(templateItem);
@@ -399,28 +511,47 @@ function loadSavedTemplates() {
 }
 
 // Load a template
-function loadTemplate(name) {
-    const templates = JSON.parse(localStorage.getItem('extractionTemplates') || '{}');
-    const template = templates[name];
+function loadTemplate(templateId) {
+    const template = savedTemplates[templateId];
     
     if (template) {
-        document.getElementById('promptInput').value = template.prompt;
-        window.schemaEditor.setValue(template.schema);
+        document.getElementById('promptInput').value = template.prompt || '';
+        window.schemaEditor.setValue(template.schema_definition ? JSON.stringify(template.schema_definition, null, 2) : '');
+        loadedTemplate = { id: templateId, prompt: document.getElementById('promptInput').value, schema: window.schemaEditor.getValue() };
     }
 }
 
+// Whether the prompt and schema are still those of the loaded template
+function isTemplateUnchanged() {
+    return loadedTemplate !== null &&
+        savedTemplates[loadedTemplate.id] !== undefined &&
+        document.getElementById('promptInput').value === loadedTemplate.prompt &&
+        window.schemaEditor.getValue() === loadedTemplate.schema;
+}
+
 // Delete a template
-function deleteTemplate(name) {
-    if (confirm(`Are you sure you want to delete the template "${name}"?`)) {
-        const templates = JSON.parse(localStorage.getItem('extractionTemplates') || '{}');
-        delete templates[name];
-        localStorage.setItem('extractionTemplates', JSON.stringify(templates));
-        loadSavedTemplates();
+async function deleteTemplate(templateId) {
+    const template = savedTemplates[templateId];
+    if (template && confirm(`Are you sure you want to delete the template "${template.name}"?`)) {
+        try {
+            const response = await fetch(`${API_BASE_URL}/templates/${templateId}`, { method: 'DELETE' });
+            if (!response.ok && response.status !== 404) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+        } catch (error) {
+            alert('Error deleting template: ' + error.message);
+            return;
+        }
+        if (loadedTemplate && loadedTemplate.id === templateId) {
+            loadedTemplate = null;
+        }
+        await loadSavedTemplates();
     }
 }
 
 // Create new template (clear form)
 function createNewTemplate() {
+    loadedTemplate = null;
     document.getElementById('promptInput').value = '';
     window.schemaEditor.setValue(getDefaultSchema());
 }
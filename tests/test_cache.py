@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from backend.core.cache import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    single_flight = SingleFlight()
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    async def main():
+        return await asyncio.gather(single_flight.run("page", call), single_flight.run("page", call))
+
+    assert asyncio.run(main()) == [(1, False), (1, True)]
+    assert single_flight.stats() == {"in_flight": 0, "deduplicated": 1}
+
+
+def test_follower_takes_over_when_the_leader_is_cancelled():
+    single_flight = SingleFlight()
+    started = []
+
+    async def call():
+        started.append(len(started) + 1)
+        await asyncio.sleep(0.05)
+        return started[-1]
+
+    async def main():
+        leader = asyncio.create_task(single_flight.run("page", call))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(single_flight.run("page", call))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    # The follower runs the call itself instead of failing with the leader
+    assert asyncio.run(main()) == (2, False)
+    assert started == [1, 2]
+    assert single_flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_follower_leaves_the_call_running():
+    single_flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.create_task(single_flight.run("page", call))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(single_flight.run("page", call))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        return await leader
+
+    assert asyncio.run(main()) == ("done", False)
+
+
+def test_errors_reach_every_caller():
+    single_flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.05)
+        raise ValueError("bad reply")
+
+    async def main():
+        return await asyncio.gather(single_flight.run("page", call), single_flight.run("page", call), return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(main())] == [ValueError, ValueError]
+    assert single_flight.stats()["in_flight"] == 0
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+import httpx
+import openai
+import pytest
+from backend.core.scheduler import RateLimitScheduler, TokenBucket, get_backoff_delay, get_retry_after
+from backend.models.api_models import APIConfig
+
+
+def make_error(error_type: type, status_code: int, headers: dict) -> Exception:
+    """A provider error as raised by the openai client"""
+    response = httpx.Response(status_code, headers=headers, request=httpx.Request("POST", "http://localhost/v1/chat/completions"))
+    return error_type("rejected", response=response, body=None)
+
+
+def make_bucket(per_minute: int, burst_seconds: float) -> TokenBucket:
+    bucket = TokenBucket(per_minute, burst_seconds)
+    bucket.updated_at = 0.0
+    return bucket
+
+
+def test_token_bucket_waits_to_repay_its_debt():
+    # 1 token per second, 10 seconds of burst
+    bucket = make_bucket(60, 10)
+    assert bucket.reserve(10, 0.0) == 0
+    assert bucket.reserve(5, 0.0) == pytest.approx(5)
+    # The next caller queues behind the debt
+    assert bucket.reserve(1, 0.0) == pytest.approx(6)
+
+
+def test_token_bucket_refills_up_to_its_capacity():
+    bucket = make_bucket(60, 10)
+    bucket.reserve(10, 0.0)
+    assert bucket.reserve(4, 4.0) == 0
+    # Idle for far longer than the burst, still only 10 tokens
+    assert bucket.reserve(10, 1000.0) == 0
+    assert bucket.reserve(1, 1000.0) == pytest.approx(1)
+
+
+def test_token_bucket_lets_calls_larger_than_its_capacity_through():
+    bucket = make_bucket(60, 10)
+    assert bucket.reserve(100, 0.0) == 0
+    assert bucket.reserve(1, 0.0) == pytest.approx(1)
+
+
+def test_token_bucket_adjusts_to_actual_usage():
+    bucket = make_bucket(60, 10)
+    bucket.reserve(10, 0.0)
+    # The call used 4 tokens less than estimated
+    bucket.adjust(-4, 0.0)
+    assert bucket.reserve(4, 0.0) == 0
+
+
+def test_retry_after_in_milliseconds():
+    assert get_retry_after(make_error(openai.RateLimitError, 429, {"retry-after-ms": "300"})) == pytest.approx(0.3)
+
+
+def test_retry_after_in_seconds():
+    assert get_retry_after(make_error(openai.RateLimitError, 429, {"retry-after": "7"})) == 7
+
+
+def test_retry_after_as_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    delay = get_retry_after(make_error(openai.RateLimitError, 429, {"retry-after": format_datetime(retry_at, usegmt=True)}))
+    assert 28 <= delay <= 30
+
+
+def test_retry_after_missing_or_invalid():
+    assert get_retry_after(make_error(openai.RateLimitError, 429, {})) is None
+    assert get_retry_after(make_error(openai.RateLimitError, 429, {"retry-after": "soon"})) is None
+    assert get_retry_after(ValueError("no response")) is None
+
+
+def test_backoff_delay_grows_with_jitter(monkeypatch):
+    monkeypatch.setattr("backend.core.scheduler.BACKOFF_BASE_SECONDS", 1)
+    monkeypatch.setattr("backend.core.scheduler.BACKOFF_MAX_SECONDS", 60)
+    for attempt, delay in [(0, 1), (3, 8), (10, 60)]:
+        assert delay / 2 <= get_backoff_delay(attempt) <= delay
+
+
+def test_rate_limit_pauses_the_quota_and_retries():
+    scheduler = RateLimitScheduler(max_retries=3)
+    api_config = APIConfig(provider="openai", api_key="k", requests_per_minute=600)
+    calls = []
+
+    async def call():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise make_error(openai.RateLimitError, 429, {"retry-after-ms": "200"})
+        return "done"
+
+    assert asyncio.run(scheduler.run(api_config, 100, call)) == "done"
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.2
+    # Every caller of the quota is held back, not only the rejected one
+    assert scheduler.get_limiter(api_config).paused_until >= calls[0] + 0.2
+
+
+def test_gives_up_after_max_retries():
+    scheduler = RateLimitScheduler(max_retries=2)
+    api_config = APIConfig(provider="openai", api_key="k")
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        raise make_error(openai.InternalServerError, 500, {"retry-after-ms": "1"})
+
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(scheduler.run(api_config, 100, call))
+    assert calls == 3
+
+
+def test_other_errors_are_not_retried():
+    scheduler = RateLimitScheduler(max_retries=2)
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        raise ValueError("bad reply")
+
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.run(APIConfig(provider="openai", api_key="k"), 100, call))
+    assert calls == 1
@@ -0,0 +1,76 @@
+import pytest
+from pydantic import ValidationError
+from backend.core.schema import compile_schema, paginate_schema
+
+INVOICE_SCHEMA = {
+    "vendor": {
+        "type": "object",
+        "properties": {
+            "name": "str",
+            "address": {"type": "object", "properties": {"city": "str", "zip": "Optional[str]"}}
+        }
+    },
+    "line_items": {
+        "type": "list",
+        "items": {"properties": {"description": "str", "quantity": "int", "price": {"type": "float", "optional": True}}}
+    },
+    "tags": "List[str]",
+    "total": "float",
+    "due_date": "Optional[str]",
+    "notes": {"type": "str", "required": False},
+    "currency": {"type": "str", "default": "EUR"}
+}
+
+
+def test_nested_objects_are_validated():
+    model = compile_schema(INVOICE_SCHEMA).model
+    invoice = model.model_validate({
+        "vendor": {"name": "ACME", "address": {"city": "Paris"}},
+        "line_items": [],
+        "tags": [],
+        "total": "12.5"
+    })
+    assert invoice.vendor.address.city == "Paris"
+    assert invoice.vendor.address.zip is None
+    assert invoice.total == 12.5
+    with pytest.raises(ValidationError):
+        model.model_validate({"vendor": {"name": "ACME", "address": {}}, "line_items": [], "tags": [], "total": 1})
+
+
+def test_list_items_have_their_own_model():
+    model = compile_schema(INVOICE_SCHEMA).model
+    invoice = model.model_validate({
+        "vendor": {"name": "ACME", "address": {"city": "Paris"}},
+        "line_items": [{"description": "Paper", "quantity": "3"}, {"description": "Ink", "quantity": 1, "price": 9.9}],
+        "tags": ["office"],
+        "total": 42
+    })
+    assert [(item.description, item.quantity, item.price) for item in invoice.line_items] == [("Paper", 3, None), ("Ink", 1, 9.9)]
+    with pytest.raises(ValidationError):
+        model.model_validate({"vendor": {"name": "ACME", "address": {"city": "Paris"}}, "line_items": [{"description": "Paper"}],
+                              "tags": [], "total": 42})
+
+
+def test_optional_fields_and_defaults():
+    json_schema = compile_schema(INVOICE_SCHEMA).json_schema
+    assert set(json_schema["required"]) == {"vendor", "line_items", "tags", "total"}
+    invoice = compile_schema(INVOICE_SCHEMA).model.model_validate({
+        "vendor": {"name": "ACME", "address": {"city": "Paris"}}, "line_items": [], "tags": [], "total": 1
+    })
+    assert (invoice.due_date, invoice.notes, invoice.currency) == (None, None, "EUR")
+
+
+def test_unsupported_types_are_rejected():
+    with pytest.raises(ValueError):
+        compile_schema({"total": "decimal"})
+
+
+def test_compiled_schemas_are_reused_regardless_of_key_order():
+    reordered = dict(reversed(list(INVOICE_SCHEMA.items())))
+    assert compile_schema(reordered) is compile_schema(INVOICE_SCHEMA)
+
+
+def test_paginated_schema_lists_one_entry_per_page():
+    model = compile_schema(paginate_schema({"total": "float"})).model
+    result = model.model_validate({"pages": [{"page_number": 1, "total": 3}, {"page_number": 2, "total": 4.5}]})
+    assert [(page.page_number, page.total) for page in result.pages] == [(1, 3.0), (2, 4.5)]
@@ -0,0 +1,79 @@
+from PIL import Image, ImageDraw, ImageFont
+from backend.core import triage
+from backend.core.triage import PageTriage, analyze_page, BLANK, DUPLICATE
+
+# An A4 page at 300 DPI, with 10 pt text
+PAGE_SIZE = (2480, 3508)
+FONT = ImageFont.load_default(size=40)
+
+
+def statement_page(page_number: int) -> Image.Image:
+    """A page of a statement: the same header and grid on every page, different line items"""
+    image = Image.new("L", PAGE_SIZE, 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((150, 150, 2330, 450), outline=0, width=6)
+    draw.text((200, 250), "ACME BANK - ACCOUNT STATEMENT", fill=0, font=FONT)
+    for row in range(40):
+        y = 600 + row * 70
+        draw.line((150, y, 2330, y), fill=0, width=2)
+        draw.text((200, y + 20), f"2024-0{page_number}-{row + 1:02d}  Payment {page_number * 100 + row}  {row * 13.37:.2f}", fill=0, font=FONT)
+    return image
+
+
+def test_pages_sharing_a_template_are_kept():
+    triage = PageTriage()
+    for page_number in range(1, 6):
+        assert triage.check(page_number, analyze_page(statement_page(page_number))) is None
+
+
+def test_identical_pages_are_duplicates():
+    triage = PageTriage()
+    assert triage.check(1, analyze_page(statement_page(1))) is None
+    assert triage.check(2, analyze_page(statement_page(2))) is None
+    skipped = triage.check(3, analyze_page(statement_page(1)))
+    assert skipped == {"page_number": 3, "reason": DUPLICATE, "duplicate_of": 1}
+
+
+def rescanned(image: Image.Image) -> Image.Image:
+    """The same page scanned again: a few specks of dust and a slightly darker paper"""
+    image = image.point(lambda value: min(value, 250))
+    draw = ImageDraw.Draw(image)
+    for x, y in [(300, 3300), (2000, 520), (1200, 3400)]:
+        draw.ellipse((x, y, x + 4, y + 4), fill=0)
+    return image
+
+
+def test_near_duplicates_are_kept_by_default():
+    triage = PageTriage()
+    assert triage.check(1, analyze_page(statement_page(1))) is None
+    assert triage.check(2, analyze_page(rescanned(statement_page(1)))) is None
+
+
+def test_near_duplicates_within_distance_are_duplicates(monkeypatch):
+    monkeypatch.setattr(triage, "DUPLICATE_MAX_DISTANCE", 12)
+    page_triage = PageTriage()
+    assert page_triage.check(1, analyze_page(statement_page(1))) is None
+    skipped = page_triage.check(2, analyze_page(rescanned(statement_page(1))))
+    assert skipped == {"page_number": 2, "reason": DUPLICATE, "duplicate_of": 1}
+
+
+def test_sparse_page_is_kept():
+    image = Image.new("L", PAGE_SIZE, 255)
+    ImageDraw.Draw(image).text((200, 200), "Signature: ____________  Date: 2024-01-31", fill=0, font=FONT)
+    assert PageTriage().check(1, analyze_page(image)) is None
+
+
+def test_single_word_page_is_kept():
+    image = Image.new("L", PAGE_SIZE, 255)
+    ImageDraw.Draw(image).text((1200, 1700), "Total", fill=0, font=FONT)
+    assert PageTriage().check(1, analyze_page(image)) is None
+
+
+def test_empty_pages_are_blank():
+    triage = PageTriage()
+    assert triage.check(1, analyze_page(Image.new("L", PAGE_SIZE, 255)))["reason"] == BLANK
+    assert triage.check(2, analyze_page(Image.new("RGB", PAGE_SIZE, (40, 40, 40))))["reason"] == BLANK
+
+
+def test_text_layer_pages_are_kept():
+    assert PageTriage().check(1, None) is None